@@ -1,12 +1,22 @@
+import asyncio
 import discord
+import glob
+import json
 import logging
+import os
 import config
 from discord.utils import get
 
 icon = config.ICON_URL
 logger = logging.getLogger(__name__)
 
-async def send_intro_message(bot):
+ANNOUNCE_CONCURRENCY = 5    # guilds announced to at the same time
+LEDGER_FILE = "announced.json"  # the version last announced and the guilds it went to
+
+_intro = None
+_running = False
+
+def read_changelog():
     changelog_lines = []
     try:
         with open("changelog.md", "r") as changelog_file:
@@ -29,7 +39,15 @@ async def send_intro_message(bot):
     else:
         version_title = "No Changelog Found"
         changelog_content = "No changelog available."
+    return version_title, changelog_content
+
+def intro_message():
+    # Parsed once per process, returns (version, embed)
+    global _intro
+    if _intro is not None:
+        return _intro
 
+    version_title, changelog_content = read_changelog()
     embed = discord.Embed(
         title="Hello! I'm Expressive!",
         description="I'm a bot designed to enhance your Discord experience with custom expressions!",
@@ -51,12 +69,92 @@ async def send_intro_message(bot):
     )
     embed.set_footer(text="Expressive | v0.3.0", icon_url=icon)
 
-    for guild in bot.guilds:
-        general_channel = get(guild.text_channels, name="general")
-        if general_channel and general_channel.permissions_for(guild.me).send_messages:
-            await general_channel.send(embed=embed)
-        else:
-            for channel in guild.text_channels:
-                if channel.permissions_for(guild.me).send_messages:
-                    await channel.send(embed=embed)
-                    break
\ No newline at end of file
+    _intro = (version_title.split(" - ")[0], embed)
+    return _intro
+
+def find_channel(guild):
+    general_channel = get(guild.text_channels, name="general")
+    if general_channel and general_channel.permissions_for(guild.me).send_messages:
+        return general_channel
+    for channel in guild.text_channels:
+        if channel.permissions_for(guild.me).send_messages:
+            return channel
+    return None
+
+def read_ledger(version):
+    # Guild ids that already got version. Each process keeps its own LEDGER_FILE
+    # with a suffix, all of them are read since guilds move between processes when
+    # the shard layout changes.
+    announced = set()
+    for name in glob.glob(f"{glob.escape(LEDGER_FILE)}*"):
+        if name.endswith(".tmp"):
+            continue
+        try:
+            with open(name, "r") as file:
+                ledger = json.load(file)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error(f"Failed to read announcement ledger {name}: {e}")
+            continue
+        if ledger.get("version") == version:
+            announced.update(ledger.get("guilds", ()))
+    return announced
+
+def write_ledger(path, version, guild_ids):
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w") as file:
+        json.dump({"version": version, "guilds": sorted(guild_ids)}, file, separators=(",", ":"))
+    os.replace(temp_path, path)
+
+async def announce_to_guild(guild, embed):
+    # True when sent, None when there's no channel to send to, False when sending failed
+    channel = find_channel(guild)
+    if channel is None:
+        return None
+    try:
+        await channel.send(embed=embed)
+    except discord.HTTPException as e:
+        logger.warning(f"Failed to send intro message to guild {guild.id}: {e}")
+        return False
+    return True
+
+async def _announce_worker(guilds, embed, version, announced):
+    # Pulls from the iterator shared by all workers, returns how many it sent to
+    sent = 0
+    for guild in guilds:
+        try:
+            result = await announce_to_guild(guild, embed)
+        except Exception as e:
+            logger.error(f"Failed to announce {version} to guild {guild.id}: {e}")
+            continue
+        if result is not False:
+            # Recorded even without a usable channel, so the guild is not retried on every start
+            announced.add(guild.id)
+        sent += result is True
+    return sent
+
+async def send_intro_message(bot, ledger_suffix=""):
+    # Runs on every on_ready, but each guild only ever gets each version once
+    global _running
+    if _running:
+        return
+    _running = True
+    try:
+        version, embed = intro_message()
+        announced = await asyncio.to_thread(read_ledger, version)
+        guilds = [guild for guild in bot.guilds if guild.id not in announced]
+        if not guilds:
+            return
+        # A fixed number of workers, not a task per guild
+        pending = iter(guilds)
+        results = await asyncio.gather(
+            *(_announce_worker(pending, embed, version, announced) for _ in range(min(ANNOUNCE_CONCURRENCY, len(guilds))))
+        )
+
+        # Only this process's guilds, the other processes write their own
+        own = {guild.id for guild in bot.guilds} & announced
+        await asyncio.to_thread(write_ledger, f"{LEDGER_FILE}{ledger_suffix}", version, own)
+        sent = sum(results)
+        if sent:
+            logger.info(f"Announced {version} in {sent} servers.")
+    finally:
+        _running = False
@@ -0,0 +1,74 @@
+# Memory used by the old cooldown dict versus CooldownStore after millions of triggers.
+# Run from the repository root: python benchmarks/bench_cooldowns.py
+
+import os
+import random
+import string
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from cooldown_store import CooldownStore
+
+TRIGGERS = 2_000_000
+GUILDS = 5_000
+EXPRESSIONS_PER_GUILD = 100
+COOLDOWN = 60.0         # seconds
+TRIGGERS_PER_SECOND = 2_000
+
+
+def make_workload(rng):
+    guild_ids = [rng.randrange(10**17, 10**18) for _ in range(GUILDS)]
+    expression_ids = [
+        ["".join(rng.choices(string.ascii_letters + string.digits, k=5)) for _ in range(EXPRESSIONS_PER_GUILD)]
+        for _ in range(GUILDS)
+    ]
+    for n in range(TRIGGERS):
+        guild = rng.randrange(GUILDS)
+        yield n / TRIGGERS_PER_SECOND, guild_ids[guild], rng.choice(expression_ids[guild])
+
+
+def run_dict(rng):
+    cooldowns = {}
+    for now, guild_id, expression_id in make_workload(rng):
+        cooldown_key = f"{guild_id}-{expression_id}"
+        if cooldown_key in cooldowns and cooldowns[cooldown_key] - now > 0:
+            continue
+        cooldowns[cooldown_key] = now + COOLDOWN
+    return cooldowns
+
+
+def run_store(rng):
+    cooldowns = CooldownStore()
+    for now, guild_id, expression_id in make_workload(rng):
+        cooldown_key = (guild_id, expression_id)
+        if cooldowns.remaining(cooldown_key, now) > 0:
+            continue
+        cooldowns.start(cooldown_key, now, COOLDOWN)
+    return cooldowns
+
+
+def measure(name, func):
+    rng = random.Random(0)
+    # Both runs also count the workload's own id lists, which are the same size
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = func(rng)
+    elapsed = time.perf_counter() - started
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:>14}: {len(result):>9} entries kept, {current / 2**20:7.1f} MiB retained, "
+          f"{peak / 2**20:7.1f} MiB peak, {elapsed:5.1f}s")
+
+
+def main():
+    print(f"{TRIGGERS:,} triggers over {GUILDS:,} guilds x {EXPRESSIONS_PER_GUILD} expressions, "
+          f"{COOLDOWN:.0f}s cooldown")
+    measure("dict + f-str", run_dict)
+    measure("CooldownStore", run_store)
+
+
+if __name__ == "__main__":
+    main()
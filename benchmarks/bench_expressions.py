@@ -0,0 +1,81 @@
+# Memory held by 100k expressions as the JSON dicts the bot used to cache versus
+# Expression objects, plus the cost of reading the fields on_message needs.
+# Run from the repository root: python benchmarks/bench_expressions.py
+
+import gc
+import json
+import os
+import random
+import string
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from expression import Expression
+
+EXPRESSIONS = 100_000
+USER_RATIO = 0.2
+
+
+def random_word(rng):
+    return "".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 9)))
+
+
+def make_json(rng):
+    # Built and parsed like a guild file, so every string is its own object as after json.load
+    expressions = []
+    for n in range(EXPRESSIONS):
+        if rng.random() < USER_RATIO:
+            trigger_type, trigger = "user", str(rng.randrange(10**17, 10**18))
+        else:
+            trigger_type, trigger = "phrase", " ".join(random_word(rng) for _ in range(rng.randint(1, 3)))
+        expressions.append({
+            "id": "".join(rng.choices(string.ascii_letters + string.digits, k=5)),
+            "trigger_type": trigger_type,
+            "trigger": trigger,
+            "action": rng.choice(["send", "reply", "react"]),
+            "response": random_word(rng),
+            "cooldown": rng.choice([0, 1, 5, 60]),
+            "created_by": f"user{rng.randrange(1000)}"
+        })
+    return json.dumps(expressions)
+
+
+def measure(name, build):
+    gc.collect()
+    tracemalloc.start()
+    expressions = build()
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:>12}: {current / 2**20:6.1f} MiB, {current / len(expressions):5.0f} bytes per expression")
+    return expressions
+
+
+def read_fields(expressions, get):
+    best = None
+    for _ in range(5):
+        started = time.perf_counter()
+        for expression in expressions:
+            get(expression)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(expressions) * 1e9
+
+
+def main():
+    text = make_json(random.Random(0))
+    print(f"{EXPRESSIONS:,} expressions, {USER_RATIO:.0%} user triggers")
+    dicts = measure("dicts", lambda: json.loads(text))
+    objects = measure("Expression", lambda: [Expression.from_dict(exp) for exp in json.loads(text)])
+
+    # The four fields on_message reads for every matched expression
+    dict_ns = read_fields(dicts, lambda exp: (exp["id"], exp["action"], exp["response"], exp["cooldown"]))
+    object_ns = read_fields(objects, lambda exp: (exp.id, exp.action, exp.response, exp.cooldown))
+    print(f"field reads: dicts {dict_ns:.0f} ns, Expression {object_ns:.0f} ns per expression")
+
+
+if __name__ == "__main__":
+    main()
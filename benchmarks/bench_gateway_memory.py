@@ -0,0 +1,160 @@
+# Memory held by discord.py's caches per 1,000 guilds, with the default client
+# options versus LOW_MEMORY, both from gateway.gateway_settings. Feeds synthetic GUILD_CREATE and
+# MESSAGE_CREATE payloads straight into a ConnectionState, no Discord connection
+# is needed (discord.py must be installed). Each mode runs in its own process so
+# the RSS numbers don't share an allocator.
+#
+# Run from the repository root, e.g.:
+#   python benchmarks/bench_gateway_memory.py --guilds 1000 --members 50 --messages 20
+
+import argparse
+import gc
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+BOT_ID = 10**17
+
+_ids = itertools.count(10**17 + 1)
+
+
+def snowflake():
+    return str(next(_ids))
+
+
+def user(user_id, name):
+    return {"id": user_id, "username": name, "discriminator": "0", "global_name": None, "avatar": None}
+
+
+def member(user_id, name):
+    return {"user": user(user_id, name), "roles": [], "joined_at": "2023-01-01T00:00:00+00:00",
+            "deaf": False, "mute": False, "flags": 0}
+
+
+def make_guild(args, voice_states):
+    guild_id = snowflake()
+    channels = [
+        {"id": snowflake(), "type": 0, "name": f"channel-{n}", "position": n,
+         "permission_overwrites": [], "nsfw": False, "parent_id": None}
+        for n in range(args.channels)
+    ]
+    roles = [
+        {"id": guild_id if n == 0 else snowflake(), "name": f"role-{n}", "color": 0, "hoist": False,
+         "position": n, "permissions": "0", "managed": False, "mentionable": False}
+        for n in range(args.roles)
+    ]
+    emojis = [
+        {"id": snowflake(), "name": f"emoji_{n}", "roles": [], "require_colons": True,
+         "managed": False, "animated": False, "available": True}
+        for n in range(args.emojis)
+    ]
+    # Without the members intent Discord only sends the bot itself and whoever is in voice
+    members = [member(str(BOT_ID), "expressive")]
+    voice = []
+    if voice_states:
+        for n in range(args.voice):
+            user_id = snowflake()
+            members.append(member(user_id, f"voice-{n}"))
+            voice.append({"user_id": user_id, "channel_id": channels[0]["id"], "session_id": "x",
+                          "deaf": False, "mute": False, "self_deaf": False, "self_mute": False,
+                          "self_video": False, "suppress": False, "request_to_speak_timestamp": None})
+    data = {
+        "id": guild_id, "name": f"guild-{guild_id}", "owner_id": snowflake(), "features": [],
+        "verification_level": 0, "default_message_notifications": 0, "explicit_content_filter": 0,
+        "mfa_level": 0, "nsfw_level": 0, "premium_tier": 0, "system_channel_flags": 0,
+        "preferred_locale": "en-US", "member_count": args.members, "large": False,
+        "channels": channels, "roles": roles, "emojis": emojis, "stickers": [], "threads": [],
+        "members": members, "voice_states": voice, "presences": [], "stage_instances": [],
+        "guild_scheduled_events": []
+    }
+    return data
+
+
+def make_message(guild, name):
+    channel = guild["channels"][0]
+    author_id = snowflake()
+    return {
+        "id": snowflake(), "channel_id": channel["id"], "guild_id": guild["id"], "type": 0,
+        "content": "hello there, this is a message someone typed", "author": user(author_id, name),
+        "member": {"roles": [], "joined_at": "2023-01-01T00:00:00+00:00", "deaf": False, "mute": False,
+                   "flags": 0},
+        "timestamp": "2023-01-01T00:00:00+00:00", "edited_timestamp": None, "tts": False,
+        "mention_everyone": False, "mentions": [], "mention_roles": [], "attachments": [],
+        "embeds": [], "pinned": False
+    }
+
+
+def rss_kib():
+    with open("/proc/self/status") as file:
+        for line in file:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+def run(args):
+    import discord
+    from discord.state import ConnectionState
+    from gateway import gateway_settings
+
+    intents, options = gateway_settings(args.mode == "low")
+
+    state = ConnectionState(dispatch=lambda *args: None, handlers={}, hooks={}, http=None,
+                            intents=intents, **options)
+    state.user = discord.ClientUser(state=state, data=user(str(BOT_ID), "expressive"))
+
+    payloads = [make_guild(args, intents.voice_states) for _ in range(args.guilds)]
+    messages = [make_message(guild, f"user-{n}") for guild in payloads for n in range(args.messages)]
+    gc.collect()
+    rss_before = rss_kib()
+    tracemalloc.start()
+    for data in payloads:
+        state._add_guild_from_data(data)
+    for data in messages:
+        state.parse_message_create(data)
+    del payloads, messages
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "traced": current, "rss": (rss_kib() - rss_before) * 1024,
+        "members": sum(len(guild._members) for guild in state.guilds),
+        "messages": len(state._messages or ())
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--guilds", type=int, default=1000)
+    parser.add_argument("--members", type=int, default=50, help="member_count reported per guild")
+    parser.add_argument("--channels", type=int, default=20)
+    parser.add_argument("--roles", type=int, default=15)
+    parser.add_argument("--emojis", type=int, default=30)
+    parser.add_argument("--voice", type=int, default=3, help="members in voice per guild")
+    parser.add_argument("--messages", type=int, default=20, help="messages seen per guild")
+    parser.add_argument("--mode", choices=("default", "low"))
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run(args)))
+        return
+
+    print(f"{args.guilds:,} guilds, {args.channels} channels, {args.roles} roles, {args.emojis} emojis, "
+          f"{args.voice} in voice, {args.messages} messages each")
+    per = 1000 / args.guilds
+    for mode in ("default", "low"):
+        output = subprocess.run([sys.executable, *sys.argv, "--mode", mode], capture_output=True,
+                                text=True, check=True).stdout
+        result = json.loads(output)
+        print(f"{mode:>8}: {result['traced'] * per / 2**20:6.1f} MiB traced, "
+              f"{result['rss'] * per / 2**20:6.1f} MiB RSS per 1,000 guilds "
+              f"({result['members']:,} members, {result['messages']:,} messages cached)")
+
+
+if __name__ == "__main__":
+    main()
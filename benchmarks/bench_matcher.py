@@ -0,0 +1,75 @@
+# Compares the compiled phrase matcher against the old per-expression substring loop.
+# Run from the repository root: python benchmarks/bench_matcher.py
+
+import os
+import random
+import string
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from matcher import PhraseMatcher
+
+SIZES = [10, 100, 1000, 10000]
+MESSAGES = 200
+MESSAGE_WORDS = 30
+
+
+def random_word(rng):
+    return "".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 9)))
+
+
+def make_phrases(rng, count):
+    return [
+        {"id": str(i), "trigger": " ".join(random_word(rng) for _ in range(rng.randint(1, 3)))}
+        for i in range(count)
+    ]
+
+
+def make_messages(rng, phrases):
+    messages = []
+    for _ in range(MESSAGES):
+        words = [random_word(rng) for _ in range(MESSAGE_WORDS)]
+        if rng.random() < 0.2:
+            words.insert(rng.randrange(len(words)), rng.choice(phrases)["trigger"].upper())
+        messages.append(" ".join(words))
+    return messages
+
+
+def naive(phrases, messages):
+    for content in messages:
+        for expression in phrases:
+            expression["trigger"].lower() in content.lower()
+
+
+def compiled(matcher, messages):
+    for content in messages:
+        matcher.search(content)
+
+
+def main():
+    rng = random.Random(0)
+    print(f"{'phrases':>8} {'loop us/msg':>12} {'matcher us/msg':>15} {'speedup':>8}")
+    for size in SIZES:
+        phrases = make_phrases(rng, size)
+        messages = make_messages(rng, phrases)
+        matcher = PhraseMatcher()
+        for expression in phrases:
+            matcher.add(expression["id"], expression["trigger"])
+        matcher.search("")
+
+        for content in messages:
+            expected = {e["id"] for e in phrases if e["trigger"].lower() in content.lower()}
+            assert matcher.search(content) == expected
+
+        repeat = max(1, 2000 // size)
+        loop_time = min(timeit.repeat(lambda: naive(phrases, messages), number=repeat, repeat=3))
+        matcher_time = min(timeit.repeat(lambda: compiled(matcher, messages), number=repeat, repeat=3))
+        per_message = 1e6 / (repeat * MESSAGES)
+        print(f"{size:>8} {loop_time * per_message:>12.1f} {matcher_time * per_message:>15.1f} "
+              f"{loop_time / matcher_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+# Offline benchmark and trace replay for the on_message handler registered in
+# event_handlers.setup. Drives the real handler with fake messages, guilds and
+# authors, so no Discord connection is needed (discord.py must be installed).
+#
+# Run from the repository root, e.g.:
+#   python benchmarks/bench_on_message.py --guilds 50 --expressions 1000 --messages 20000
+#   python benchmarks/bench_on_message.py --record trace.jsonl
+#   python benchmarks/bench_on_message.py --replay trace.jsonl --output new.json --baseline old.json
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import string
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+try:
+    import config
+except ImportError:
+    # Offline runs need no token, config is only read for embed icons
+    sys.modules["config"] = SimpleNamespace(ICON_URL=None)
+
+import event_handlers
+import file_handling
+from throttle import Throttle
+
+
+class FakeBot:
+    def __init__(self):
+        self.events = {}
+
+    def event(self, func):
+        self.events[func.__name__] = func
+        return func
+
+
+class FakeChannel:
+    def __init__(self, channel_id):
+        self.id = channel_id
+        self.sent = 0
+
+    async def send(self, *args, **kwargs):
+        self.sent += 1
+
+
+class FakeMessage:
+    def __init__(self, guild, author, channel, content):
+        self.guild = guild
+        self.author = author
+        self.channel = channel
+        self.content = content
+
+    async def reply(self, *args, **kwargs):
+        self.channel.sent += 1
+
+    async def add_reaction(self, emoji):
+        self.channel.sent += 1
+
+
+def random_word(rng):
+    return "".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 9)))
+
+
+def make_guild_data(rng, args, guild_id, user_ids):
+    expressions = []
+    for n in range(args.expressions):
+        if rng.random() < args.user_ratio:
+            trigger_type, trigger = "user", rng.choice(user_ids)
+        else:
+            trigger_type, trigger = "phrase", " ".join(random_word(rng) for _ in range(rng.randint(1, 2)))
+        expressions.append({
+            "id": f"{n:05d}",
+            "trigger_type": trigger_type,
+            "trigger": trigger,
+            "action": rng.choice(["send", "reply", "react"]),
+            "response": "👍",
+            "cooldown": args.cooldown,
+            "created_by": "bench"
+        })
+    return {"info": {"id": str(guild_id)}, "expressions": expressions}
+
+
+def make_trace(rng, args, guilds, user_ids):
+    # A share of messages contain one of the guild's phrases so the match path gets exercised
+    trace = []
+    for _ in range(args.messages):
+        guild_id = rng.choice(list(guilds))
+        words = [random_word(rng) for _ in range(max(1, args.message_length // 7))]
+        phrases = [exp["trigger"] for exp in guilds[guild_id]["expressions"] if exp["trigger_type"] == "phrase"]
+        if phrases and rng.random() < args.hit_ratio:
+            words.insert(rng.randrange(len(words) + 1), rng.choice(phrases))
+        trace.append({
+            "guild_id": guild_id,
+            "channel_id": guild_id + rng.randrange(5),
+            "author_id": rng.choice(user_ids),
+            "content": " ".join(words)
+        })
+    return trace
+
+
+def percentile(values, share):
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+async def run(trace, on_message):
+    guilds, authors, channels = {}, {}, {}
+    messages = []
+    for entry in trace:
+        guild = guilds.setdefault(entry["guild_id"], SimpleNamespace(id=entry["guild_id"]))
+        author = authors.setdefault(entry["author_id"], SimpleNamespace(id=entry["author_id"], bot=False))
+        channel = channels.setdefault(entry["channel_id"], FakeChannel(entry["channel_id"]))
+        messages.append(FakeMessage(guild, author, channel, entry["content"]))
+
+    latencies = []
+    # Net change in allocated blocks: what each message leaves behind, not every
+    # allocation made while handling it
+    retained = 0
+    started = time.perf_counter()
+    for message in messages:
+        before_blocks = sys.getallocatedblocks()
+        before = time.perf_counter()
+        await on_message(message)
+        latencies.append(time.perf_counter() - before)
+        retained += sys.getallocatedblocks() - before_blocks
+    elapsed = time.perf_counter() - started
+
+    while event_handlers.dispatcher.pending:
+        await asyncio.sleep(0.01)
+    await event_handlers.dispatcher.close()
+    await file_handling.store.flush()
+
+    latencies.sort()
+    return {
+        "messages": len(messages),
+        "messages_per_sec": len(messages) / elapsed,
+        "p50_us": percentile(latencies, 0.50) * 1e6,
+        "p99_us": percentile(latencies, 0.99) * 1e6,
+        "retained_blocks_per_message": retained / len(messages),
+        "responses": sum(channel.sent for channel in channels.values())
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the on_message hot path offline")
+    parser.add_argument("--guilds", type=int, default=20)
+    parser.add_argument("--expressions", type=int, default=200, help="expressions per guild")
+    parser.add_argument("--user-ratio", type=float, default=0.2, help="share of user triggers")
+    parser.add_argument("--users", type=int, default=500, help="distinct message authors")
+    parser.add_argument("--messages", type=int, default=10000)
+    parser.add_argument("--message-length", type=int, default=120, help="approximate characters per message")
+    parser.add_argument("--hit-ratio", type=float, default=0.1, help="share of messages containing a phrase")
+    parser.add_argument("--cooldown", type=int, default=1, help="cooldown in minutes for every expression")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", help="existing serverdata directory to use instead of synthetic data")
+    parser.add_argument("--record", help="write the synthetic trace as JSON lines to this file")
+    parser.add_argument("--replay", help="replay a JSON lines trace instead of generating one")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="compare against results written earlier with --output")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    file_handling.DATA_DIR = args.data_dir or tempfile.mkdtemp(prefix="expressive-bench-")
+    user_ids = [rng.randrange(10**17, 10**18) for _ in range(args.users)]
+
+    if not args.data_dir:
+        guilds = {}
+        for _ in range(args.guilds):
+            guild_id = rng.randrange(10**17, 10**18)
+            guilds[guild_id] = make_guild_data(rng, args, guild_id, user_ids)
+            file_handling.get_backend().write(str(guild_id), guilds[guild_id])
+        file_handling._cache.clear()
+
+    if args.replay:
+        with open(args.replay, "r") as file:
+            trace = [json.loads(line) for line in file if line.strip()]
+    else:
+        if args.data_dir:
+            parser.error("--data-dir needs --replay, synthetic traces are built from synthetic guilds")
+        trace = make_trace(rng, args, guilds, user_ids)
+
+    if args.record:
+        with open(args.record, "w") as file:
+            for entry in trace:
+                file.write(json.dumps(entry) + "\n")
+
+    # Traces replay as fast as possible instead of at their real pace, so throttles would drop most of them
+    event_handlers.throttle = Throttle({"user_per_minute": 0, "channel_per_minute": 0})
+    bot = FakeBot()
+    event_handlers.setup(bot)
+    results = asyncio.run(run(trace, bot.events["on_message"]))
+
+    for key, value in results.items():
+        print(f"{key:>27}: {value:,.1f}" if isinstance(value, float) else f"{key:>27}: {value:,}")
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=4)
+
+    if args.baseline:
+        with open(args.baseline, "r") as file:
+            baseline = json.load(file)
+        print("\nChange against baseline:")
+        for key in ("messages_per_sec", "p50_us", "p99_us", "retained_blocks_per_message"):
+            if baseline.get(key):
+                print(f"{key:>27}: {(results[key] - baseline[key]) / baseline[key] * 100:+.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+# Regression check for regex triggers that backtrack badly: every search has to
+# stop within PATTERN_BUDGET, and after PATTERN_STRIKES slow messages in a row
+# only the guild's regex triggers are switched off, word triggers keep matching.
+# Run from the repository root: python benchmarks/bench_slow_patterns.py
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from matcher import MAX_PATTERN_TEXT, PATTERN_BUDGET, PATTERN_STRIKES, PatternMatcher, validate_trigger
+
+# (pattern, message it is slow on), these took from seconds to minutes with the re module
+CASES = [
+    (r"(a|a)*b", "a" * 26),
+    (r"(a|aa)+$", "a" * 37 + "!"),
+    (r".*.*.*.*=", "x" * 400),
+    (r".*.*.*.*=", "x" * MAX_PATTERN_TEXT),
+    (r"(\w|\d)*!", "1" * MAX_PATTERN_TEXT),
+]
+LIMIT = PATTERN_BUDGET * 4      # allowed per search, leaves room for a busy machine
+
+
+def main():
+    failed = False
+    for pattern, text in CASES:
+        error = validate_trigger("regex", pattern)
+        if error:
+            print(f"{pattern!r:>14} rejected: {error}")
+            continue
+
+        matcher = PatternMatcher()
+        matcher.add("slow", "regex", pattern)
+        matcher.add("word", "word", "hello")
+        message = f"hello {text}"
+
+        slowest = 0.0
+        for _ in range(PATTERN_STRIKES):
+            started = time.perf_counter()
+            matcher.search(message)
+            slowest = max(slowest, time.perf_counter() - started)
+        found = matcher.search(message)
+
+        ok = slowest <= LIMIT and "word" in found
+        failed = failed or not ok
+        state = "regex off" if matcher.disabled else "regex on"
+        print(f"{pattern!r:>14} {len(text):>5} chars: slowest search {slowest * 1000:6.2f} ms, "
+              f"{state}, word trigger {'matched' if 'word' in found else 'LOST'} {'ok' if ok else 'FAIL'}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
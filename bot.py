@@ -3,23 +3,113 @@ import discord
 from discord.ext import commands
 import config
 import logging
+import os
+import asyncio
 import event_handlers
+import metrics
 import bot_commands
 
+import file_handling
+from expression_logs import log_queue
+from file_handling import store
+from gateway import gateway_settings
+from sqlite_storage import SqliteBackend
+from throttle import Throttle
+from tree_sync import sync_if_changed
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s:%(levelname)s:%(name)s: %(message)s')
 logger = logging.getLogger(__name__)
 
-intents = discord.Intents.default()
-intents.message_content = True
-bot = commands.Bot(command_prefix="!", intents=intents)
+if getattr(config, "SQLITE_PATH", None):
+    file_handling.use_backend(SqliteBackend(config.SQLITE_PATH))
+
+intents, client_options = gateway_settings(getattr(config, "LOW_MEMORY", False))
+
+# Set by launcher.py when the bot runs as several processes
+process_index = int(os.environ.get("EXPRESSIVE_PROCESS_INDEX", 0))
+shard_ids = os.environ.get("EXPRESSIVE_SHARD_IDS")
+shard_ids = [int(shard_id) for shard_id in shard_ids.split(",")] if shard_ids else None
+shard_count = os.environ.get("EXPRESSIVE_SHARD_COUNT") or getattr(config, "SHARD_COUNT", None)
+shard_count = int(shard_count) if shard_count else None
+primary = process_index == 0
+force_sync = os.environ.get("EXPRESSIVE_FORCE_SYNC") == "1"
+
+cooldown_snapshot = getattr(config, "COOLDOWN_SNAPSHOT", None)
+if cooldown_snapshot and shard_ids:
+    cooldown_snapshot = f"{cooldown_snapshot}.{process_index}"
+announce_suffix = f".{process_index}" if shard_ids else ""
+if getattr(config, "SHED_LAG", None):
+    event_handlers.shedder.thresholds = tuple(config.SHED_LAG)
+event_handlers.shedder.low_priority_guilds.update(getattr(config, "LOW_PRIORITY_GUILDS", ()))
+event_handlers.shedder.low_priority_channels.update(getattr(config, "LOW_PRIORITY_CHANNELS", ()))
+if getattr(config, "THROTTLE_DEFAULTS", None):
+    event_handlers.throttle = Throttle(config.THROTTLE_DEFAULTS)
+metrics_port = getattr(config, "METRICS_PORT", None)
+if metrics_port:
+    metrics_port += process_index
+
+class ExpressiveBot(commands.AutoShardedBot):
+    async def setup_hook(self):
+        metrics_file = getattr(config, "METRICS_FILE", None)
+        self.metrics_tasks = metrics.start(
+            port=metrics_port,
+            path=f"{metrics_file}.{process_index}" if metrics_file and shard_ids else metrics_file
+        )
+        self.metrics_tasks.append(asyncio.create_task(self.report_shards()))
+        self.metrics_tasks.append(asyncio.create_task(event_handlers.shedder.monitor()))
+        self.metrics_tasks.append(asyncio.create_task(event_handlers.stats.flush_periodically(store)))
+        if cooldown_snapshot:
+            event_handlers.cooldowns.load_snapshot(cooldown_snapshot, self.loop.time())
+
+    async def close(self):
+        # Write out the collected stats and any guild data still waiting in the write-behind queue
+        await event_handlers.stats.flush(store)
+        await store.flush()
+        event_handlers.plans.close()
+        await event_handlers.dispatcher.close()
+        await log_queue.flush()
+        if cooldown_snapshot:
+            event_handlers.cooldowns.save_snapshot(cooldown_snapshot, self.loop.time())
+        await super().close()
+
+    async def report_shards(self, interval=30):
+        while True:
+            await asyncio.sleep(interval)
+            for shard_id, latency in self.latencies:
+                metrics.shard_latency.set(latency, shard_id)
+
+bot = ExpressiveBot(
+    command_prefix="!", intents=intents, shard_ids=shard_ids, shard_count=shard_count, **client_options
+)
+
+@bot.event
+async def on_shard_ready(shard_id):
+    metrics.shard_up.set(1, shard_id)
+    logger.info(f"Shard {shard_id} ready.")
+
+@bot.event
+async def on_shard_disconnect(shard_id):
+    metrics.shard_up.set(0, shard_id)
+    logger.warning(f"Shard {shard_id} disconnected.")
+
+@bot.event
+async def on_shard_resumed(shard_id):
+    metrics.shard_up.set(1, shard_id)
+    logger.info(f"Shard {shard_id} resumed.")
 
 @bot.event
 async def on_ready():
-    try:
-        await bot.tree.sync()
-        logger.info("Slash commands synced.")
-    except Exception as e:
-        logger.error(f"Failed to sync slash commands: {e}")
+    global force_sync
+    # The command tree is global, one process syncing it is enough
+    if primary:
+        try:
+            if await sync_if_changed(bot.tree, force=force_sync):
+                force_sync = False
+                logger.info("Slash commands synced.")
+            else:
+                logger.info("Slash commands unchanged, skipped sync.")
+        except Exception as e:
+            logger.error(f"Failed to sync slash commands: {e}")
 
     try:
         server_count = len(bot.guilds)
@@ -28,10 +118,11 @@ async def on_ready():
         logger.info("Presence loaded.")
     except Exception as e:
         logger.error(f"Failed to set presence: {e}")
-    await send_intro_message(bot)
+    await send_intro_message(bot, announce_suffix)
     logger.info(f"Logged in as {bot.user}.")
 
 event_handlers.setup(bot)
 bot_commands.setup(bot)
 
-bot.run(config.TOKEN)
\ No newline at end of file
+bot.run(config.TOKEN)
+store.close()
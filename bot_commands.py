@@ -1,16 +1,23 @@
 import asyncio
 import config
 import discord
+import io
 import logging
-import random
 import re
-import string
+import tempfile
 
+from collections import OrderedDict
 from discord import app_commands
 from discord.ui import View, Button, Select
 from datetime import datetime
 
-from file_handling import load_expressions, save_expressions
+import event_handlers
+from compound import plan_error
+from expression import Expression, TriggerType
+from expression_io import FORMATS, MAX_IMPORT_SIZE, apply_import, guess_format, read_rows, validate_rows, write_export
+from expression_logs import queue_log
+from file_handling import drop_index, store
+from matcher import validate_trigger
 
 logger = logging.getLogger(__name__)
 
@@ -18,6 +25,71 @@ icon = config.ICON_URL
 embed_color = 0xc15bb2
 footer_text = "Expressive"
 
+LIST_PREFIX = "exprlist"
+LIST_PAGE_SIZE = 10
+LIST_TTL = 15 * 60      # seconds an /expression_list message keeps responding to clicks
+USER_CACHE_SIZE = 256   # usernames remembered by resolve_user_trigger
+TRIGGER_TYPES = tuple(trigger_type.value for trigger_type in TriggerType)
+STATS_TOP = 10          # expressions listed per section of /expression_stats
+
+# (guild_id, username) -> user id, so repeated commands don't query the gateway again
+_user_cache = OrderedDict()
+
+async def resolve_user_trigger(guild, trigger):
+    match = re.match(r"<@!?(\d+)>", trigger)
+    if match:
+        return int(match.group(1))
+    if trigger.isdigit():
+        return int(trigger)
+
+    key = (guild.id, trigger)
+    user_id = _user_cache.get(key)
+    if user_id is not None:
+        _user_cache.move_to_end(key)
+        return user_id
+
+    # The member cache is mostly empty, ask the gateway instead of scanning it
+    try:
+        members = await guild.query_members(query=trigger, limit=5, cache=False)
+    except (asyncio.TimeoutError, discord.ClientException) as e:
+        logger.warning(f"Failed to look up user {trigger!r} in guild {guild.id}: {e}")
+        return None
+    user = discord.utils.get(members, name=trigger)
+    if user is None:
+        return None
+
+    _user_cache[key] = user.id
+    while len(_user_cache) > USER_CACHE_SIZE:
+        _user_cache.popitem(last=False)
+    return user.id
+
+def format_last_triggered(last_triggered):
+    return f"<t:{last_triggered}:R>" if last_triggered else "Never"
+
+def make_expression_embed(expression, totals=None):
+    trigger = expression.trigger
+    if expression.trigger_type == "user":
+        trigger = f"<@{trigger}>"
+
+    embed = discord.Embed(
+        title=f"Expression Details - {expression.id}",
+        colour=embed_color,
+        timestamp=datetime.now()
+    )
+    embed.add_field(name="Trigger Type", value=str(expression.trigger_type), inline=True)
+    embed.add_field(name="Trigger", value=trigger, inline=True)
+    embed.add_field(name="Action", value=str(expression.action), inline=True)
+    embed.add_field(name="Response", value=expression.response, inline=True)
+    embed.add_field(name="Cooldown", value=f"{expression.cooldown} minutes", inline=True)
+    embed.add_field(name="Created By", value=expression.created_by, inline=True)
+    if totals:
+        hits, last_triggered, suppressed = totals
+        embed.add_field(name="Times Triggered", value=str(hits), inline=True)
+        embed.add_field(name="Last Triggered", value=format_last_triggered(last_triggered), inline=True)
+        embed.add_field(name="Skipped by Cooldown", value=str(suppressed), inline=True)
+    embed.set_footer(text=footer_text, icon_url=icon)
+    return embed
+
 def setup(bot):
     @bot.tree.command(name="help", description="Show all available commands")
     async def help_command(interaction: discord.Interaction):
@@ -31,8 +103,12 @@ def setup(bot):
                 "**/expression_list** - Show a list of all expressions on the server\n"
                 "**/expression_delete** - Delete an expression by ID\n"
                 "**/expression_info** - Show detailed information about an expression by ID\n"
+                "**/expression_stats** - Show the most and never triggered expressions\n"
+                "**/expression_export** - Download the server's expressions as a file\n"
+                "**/expression_import** - Add expressions from a JSON or CSV file\n"
                 "**/expression_role** - Set who can manage expressions\n"
-                "**/expression_logs** - Configure logging for Expressions"
+                "**/expression_logs** - Configure logging for Expressions\n"
+                "**/expression_throttle** - Limit how often members and channels can trigger Expressions"
             ),
             colour=embed_color,
             timestamp=datetime.now()
@@ -44,12 +120,12 @@ def setup(bot):
         await interaction.response.send_message(embed=embed)
 
 
-    @bot.tree.command(name="expression_new", description="Add a new user or phrase trigger expression")
+    @bot.tree.command(name="expression_new", description="Add a new user, phrase, word or regex trigger expression")
     @app_commands.describe(
-        trigger_type="Trigger type: user or phrase",
-        trigger="User ID or phrase",
+        trigger_type="Trigger type: user, phrase, word or regex",
+        trigger="User ID, phrase, word or regex",
         action="Select an action",
-        response="Message, URL, or emoji",
+        response="Message, URL, emoji, or a compound script like: send Hi; wait 5; react 👋",
         cooldown="Cooldown in minutes"
     )
     async def expression_new(
@@ -60,6 +136,8 @@ def setup(bot):
         response: str,
         cooldown: int
     ):
+        # Looking a username up can take a while, longer than Discord waits for a response
+        await interaction.response.defer(ephemeral=True)
         trigger_type = trigger_type.lower()
         action = action.lower()
 
@@ -67,21 +145,21 @@ def setup(bot):
                     #action}, trigger={trigger}, response={response}, cooldown={cooldown}")
 
         if trigger_type == "user":
-            match = re.match(r"<@!?(\d+)>", trigger)
-            if match:
-                user_id = match.group(1)
-            elif trigger.isdigit():
-                user_id = trigger
-            else:
-                user = discord.utils.get(interaction.guild.members, name=trigger)
-                if not user:
-                    await interaction.response.send_message("User not found!", ephemeral=True)
-                    return
-                user_id = str(user.id)
+            user_id = await resolve_user_trigger(interaction.guild, trigger)
+            if user_id is None:
+                await interaction.followup.send("User not found!", ephemeral=True)
+                return
             trigger = user_id
 
+        error = validate_trigger(trigger_type, trigger)
+        if not error and action == "compound":
+            error = plan_error(response)
+        if error:
+            await interaction.followup.send(error, ephemeral=True)
+            return
+
         guild_id = str(interaction.guild.id)
-        server_data = load_expressions(guild_id)
+        server_data = await store.load(guild_id)
         if "info" not in server_data or not server_data["info"]:
             server_data["info"] = {
                 "id": guild_id,
@@ -89,19 +167,12 @@ def setup(bot):
                 "invited_at": str(interaction.guild.me.joined_at)
             }
 
-        expression_id = ''.join(random.choices(
-            string.ascii_letters + string.digits, k=5))
-        expression = {
-            "id": expression_id,
-            "trigger_type": trigger_type,
-            "trigger": trigger,
-            "action": action,
-            "response": response,
-            "cooldown": cooldown,
-            "created_by": str(interaction.user)
-        }
-        server_data["expressions"].append(expression)
-        save_expressions(guild_id, server_data)
+        index = await store.load_index(guild_id)
+        expression_id = index.new_id()
+        expression = Expression(expression_id, trigger_type, trigger, action, response, cooldown, str(interaction.user))
+        server_data["expressions"][expression_id] = expression
+        index.add(expression)
+        await store.save(guild_id, server_data)
         # logger.info(f"Expression added: {expression}")
         log_message = (
             f"**New Expression Created**\n"
@@ -111,13 +182,15 @@ def setup(bot):
             f"**Action:** {action}"
         )
         await send_log(interaction, "log_create", log_message)
-        await interaction.response.send_message(f"Expression added successfully! ID: {expression_id}", ephemeral=True)
+        await interaction.followup.send(f"Expression added successfully! ID: {expression_id}", ephemeral=True)
 
     @expression_new.autocomplete("trigger_type")
     async def trigger_type_autocomplete(interaction: discord.Interaction, current: str):
         return [
             app_commands.Choice(name="User", value="user"),
-            app_commands.Choice(name="Phrase", value="phrase")
+            app_commands.Choice(name="Phrase", value="phrase"),
+            app_commands.Choice(name="Word", value="word"),
+            app_commands.Choice(name="Regex", value="regex")
         ]
 
     @expression_new.autocomplete("action")
@@ -125,16 +198,17 @@ def setup(bot):
         return [
             app_commands.Choice(name="Send", value="send"),
             app_commands.Choice(name="Reply", value="reply"),
-            app_commands.Choice(name="React", value="react")
+            app_commands.Choice(name="React", value="react"),
+            app_commands.Choice(name="Compound", value="compound")
         ]
     
     @bot.tree.command(name="expression_edit", description="Edit an existing expression by ID")
     @app_commands.describe(
         expression_id="The ID of the expression to edit",
-        trigger_type="New trigger type: user or phrase",
-        trigger="New user ID or phrase",
+        trigger_type="New trigger type: user, phrase, word or regex",
+        trigger="New user ID, phrase, word or regex",
         action="New action",
-        response="New message, URL, or emoji",
+        response="New message, URL, emoji, or compound script",
         cooldown="New cooldown in minutes"
     )
     async def expression_edit(
@@ -146,46 +220,64 @@ def setup(bot):
         response: str = None,
         cooldown: int = None
     ):
+        await interaction.response.defer(ephemeral=True)
         guild_id = str(interaction.guild.id)
-        server_data = load_expressions(guild_id)
-        expressions = server_data.get("expressions", [])
+        server_data = await store.load(guild_id)
+        index = await store.load_index(guild_id)
 
-        expression_to_edit = next(
-            (exp for exp in expressions if exp["id"] == expression_id), None)
+        expression_to_edit = index.expressions.get(expression_id)
         if not expression_to_edit:
-            await interaction.response.send_message(f"No expression found with ID {expression_id}.", ephemeral=True)
+            await interaction.followup.send(f"No expression found with ID {expression_id}.", ephemeral=True)
+            return
+
+        new_trigger_type = trigger_type.lower() if trigger_type else expression_to_edit.trigger_type
+        if new_trigger_type == "user" and trigger:
+            user_id = await resolve_user_trigger(interaction.guild, trigger)
+            if user_id is None:
+                await interaction.followup.send("User not found!", ephemeral=True)
+                return
+            trigger = user_id
+        elif new_trigger_type != "user" and not trigger and not isinstance(expression_to_edit.trigger, str):
+            trigger = str(expression_to_edit.trigger)
+
+        error = validate_trigger(new_trigger_type, trigger or expression_to_edit.trigger)
+        if not error and (action.lower() if action else expression_to_edit.action) == "compound":
+            error = plan_error(response or expression_to_edit.response)
+        if error:
+            await interaction.followup.send(error, ephemeral=True)
             return
 
         if trigger_type:
-            expression_to_edit["trigger_type"] = trigger_type.lower()
+            expression_to_edit.trigger_type = trigger_type.lower()
         if trigger:
-            expression_to_edit["trigger"] = trigger
+            expression_to_edit.trigger = trigger
         if action:
-            expression_to_edit["action"] = action.lower()
+            expression_to_edit.action = action.lower()
         if response:
-            expression_to_edit["response"] = response
+            expression_to_edit.response = response
         if cooldown is not None:
-            expression_to_edit["cooldown"] = cooldown
+            expression_to_edit.cooldown = cooldown
 
-        save_expressions(guild_id, server_data)
+        await store.save(guild_id, server_data)
         #logger.info(f"Expression edited: {expression_to_edit}")
         changes = []
         if trigger_type:
-            changes.append(f"Trigger Type: {expression_to_edit['trigger_type']} -> {trigger_type.lower()}")
-            expression_to_edit["trigger_type"] = trigger_type.lower()
+            changes.append(f"Trigger Type: {expression_to_edit.trigger_type} -> {trigger_type.lower()}")
+            expression_to_edit.trigger_type = trigger_type.lower()
         if trigger:
-            changes.append(f"Trigger: {expression_to_edit['trigger']} -> {trigger}")
-            expression_to_edit["trigger"] = trigger
+            changes.append(f"Trigger: {expression_to_edit.trigger} -> {trigger}")
+            expression_to_edit.trigger = trigger
         if action:
-            changes.append(f"Action: {expression_to_edit['action']} -> {action.lower()}")
-            expression_to_edit["action"] = action.lower()
+            changes.append(f"Action: {expression_to_edit.action} -> {action.lower()}")
+            expression_to_edit.action = action.lower()
         if response:
-            changes.append(f"Response: {expression_to_edit['response']} -> {response}")
-            expression_to_edit["response"] = response
+            changes.append(f"Response: {expression_to_edit.response} -> {response}")
+            expression_to_edit.response = response
         if cooldown is not None:
-            changes.append(f"Cooldown: {expression_to_edit['cooldown']} -> {cooldown}")
-            expression_to_edit["cooldown"] = cooldown
-        save_expressions(guild_id, server_data)
+            changes.append(f"Cooldown: {expression_to_edit.cooldown} -> {cooldown}")
+            expression_to_edit.cooldown = cooldown
+        index.update(expression_to_edit)
+        await store.save(guild_id, server_data)
         log_message = (
             f"**Expression Edited**\n"
             f"**ID:** {expression_id}\n"
@@ -193,7 +285,7 @@ def setup(bot):
             f"**Changes:**\n" + "\n".join(changes)
         )
         await send_log(interaction, "log_edit", log_message)
-        await interaction.response.send_message(f"Expression with ID {expression_id} edited successfully.", ephemeral=True)
+        await interaction.followup.send(f"Expression with ID {expression_id} edited successfully.", ephemeral=True)
 
 
     @bot.tree.command(name="expression_guide", description="Show a guide on how to make expressions")
@@ -205,18 +297,21 @@ def setup(bot):
         embed.add_field(name="Using /expression_new",
                             value="This slash command will autofill all settable parameters for Expressions with options for all.",
                             inline=False)
-        embed.add_field(name="Trigger Type - User / Phrase",
-                            value="The parameter `trigger_type` will decide what will trigger this expression. **User** means that this expression will trigger when said user sends a message. **Phrase** means it will trigger when a set phrase is used.",
+        embed.add_field(name="Trigger Type - User / Phrase / Word / Regex",
+                            value="The parameter `trigger_type` will decide what will trigger this expression. **User** means that this expression will trigger when said user sends a message. **Phrase** means it will trigger when a set phrase is used anywhere in a message. **Word** only triggers on the whole word, so *cat* won't trigger on *concatenate*. **Regex** triggers when a regular expression matches the message.",
                             inline=False)
-        embed.add_field(name="Trigger - UID / Phrase",
-                            value="The parameter `trigger` will set the actual trigger for this expression. If `trigger_type` is set to **User**, input a user ID. If it's set to **Phrase**, input a custom phrase.",
+        embed.add_field(name="Trigger - UID / Phrase / Word / Regex",
+                            value="The parameter `trigger` will set the actual trigger for this expression. If `trigger_type` is set to **User**, input a user ID. If it's set to **Phrase** or **Word**, input a custom phrase or word. If it's set to **Regex**, input a regular expression - nested repeats like `(a+)+` and backreferences aren't allowed, since they can be very slow.",
                             inline=False)
-        embed.add_field(name="Action - Send / Reply / React",
-                            value="The parameter `action` will set what the bot will do in response to an expression being triggered. **Send** will send a message (without a reply). **Reply** will reply (with ping) to the message that triggered the expression. **React** will react with a set emote to the trigger.",
+        embed.add_field(name="Action - Send / Reply / React / Compound",
+                            value="The parameter `action` will set what the bot will do in response to an expression being triggered. **Send** will send a message (without a reply). **Reply** will reply (with ping) to the message that triggered the expression. **React** will react with a set emote to the trigger. **Compound** runs several steps from `response` in order.",
                             inline=False)
         embed.add_field(name="Response - Text / Emote",
                             value="The parameter `response` is a free field which allows you to set what the bot will respond with upon triggering the expression. If `action` is set to **React**, you __HAVE__ to input a single emoji that the bot has access to.",
                             inline=False)
+        embed.add_field(name="Compound - Steps",
+                            value="With **Compound**, `response` is a list of steps separated by `;`: `send text`, `reply text`, `react emoji` and `wait seconds` (up to 600). Put `if chance 50`, `if contains word`, `if user ID` or `if channel ID` in front of a step to only run it sometimes. Example: `reply Hi!; wait 3; if chance 25 react 🎉`. Write `\\;` for a semicolon inside a message.",
+                            inline=False)
         embed.add_field(name="Cooldown - Number",
                             value="The parameter `cooldown` sets how long until this expression can be triggered again. The unit is **Minutes**. Setting `cooldown` to **0** means there will be no cooldown, and the expression will trigger whenever possible. The same expression will **NOT** trigger multiple times on one message, regardless if the trigger phrase was used more than once. However, multiple expressions can trigger on one message.",
                             inline=False)
@@ -231,14 +326,13 @@ def setup(bot):
     @app_commands.describe(expression_id="The ID of the expression to delete")
     async def expression_delete(interaction: discord.Interaction, expression_id: str):
         guild_id = str(interaction.guild.id)
-        server_data = load_expressions(guild_id)
-        expressions = server_data.get("expressions", [])
+        server_data = await store.load(guild_id)
+        index = await store.load_index(guild_id)
 
-        expression_to_delete = next(
-            (exp for exp in expressions if exp["id"] == expression_id), None)
+        expression_to_delete = index.expressions.get(expression_id)
         if expression_to_delete:
-            expressions.remove(expression_to_delete)
-            save_expressions(guild_id, server_data)
+            index.delete(server_data["expressions"], expression_to_delete)
+            await store.save(guild_id, server_data)
             # logger.info(f"Expression deleted: {expression_to_delete}")
             log_message = (
             f"**Expression Deleted**\n"
@@ -253,143 +347,289 @@ def setup(bot):
     @app_commands.describe(expression_id="The ID of the expression to display")
     async def expression_info(interaction: discord.Interaction, expression_id: str):
         guild_id = str(interaction.guild.id)
-        server_data = load_expressions(guild_id)
-        expressions = server_data.get("expressions", [])
-
-        expression = next((exp for exp in expressions if exp["id"] == expression_id), None)
+        index = await store.load_index(guild_id)
+        expression = index.expressions.get(expression_id)
 
         if expression:
-            trigger = expression["trigger"]
-            if expression["trigger_type"] == "user":
-                trigger = f"<@{trigger}>"
-
-            embed = discord.Embed(
-                title=f"Expression Details - {expression['id']}",
-                colour=embed_color,
-                timestamp=datetime.now()
-            )
-            embed.add_field(name="Trigger Type", value=expression["trigger_type"], inline=True)
-            embed.add_field(name="Trigger", value=trigger, inline=True)
-            embed.add_field(name="Action", value=expression["action"], inline=True)
-            embed.add_field(name="Response", value=expression["response"], inline=True)
-            embed.add_field(name="Cooldown", value=f"{expression['cooldown']} minutes", inline=True)
-            embed.add_field(name="Created By", value=expression["created_by"], inline=True)
-            embed.set_footer(text=footer_text, icon_url=icon)
-
-            await interaction.response.send_message(embed=embed, ephemeral=False)
+            totals = event_handlers.stats.totals(guild_id, expression)
+            await interaction.response.send_message(embed=make_expression_embed(expression, totals), ephemeral=False)
         else:
             await interaction.response.send_message(f"No expression found with ID {expression_id}.", ephemeral=False)
 
-    class ExpressionListView(View):
-        def __init__(self, interaction, expressions, page=0):
-            super().__init__(timeout=None)
-            self.interaction = interaction
-            self.expressions = expressions
-            self.page = page
-            self.update_view()
+    @bot.tree.command(name="expression_stats", description="Show which expressions trigger the most, and which never do")
+    async def expression_stats(interaction: discord.Interaction):
+        guild_id = str(interaction.guild.id)
+        server_data = await store.load(guild_id)
+        if not server_data["expressions"]:
+            await interaction.response.send_message("No expressions found on this server.", ephemeral=False)
+            return
 
-        def update_view(self):
-            self.clear_items()
-            start = self.page * 10
-            end = start + 10
-            current_expressions = self.expressions[start:end]
+        totals = [(event_handlers.stats.totals(guild_id, exp), exp) for exp in server_data["expressions"].values()]
+        fired = sorted((item for item in totals if item[0][0]), key=lambda item: item[0][0], reverse=True)
+        never = [exp for (hits, _, _), exp in totals if not hits]
 
-            select = Select(placeholder="Select an expression by ID", min_values=1, max_values=1)
-            for exp in current_expressions:
-                select.add_option(label=exp["id"], value=exp["id"])
-            select.callback = self.select_callback
-            self.add_item(select)
+        top_lines = [
+            f"`{exp.id}` | {exp.trigger_type} | {hits} times, last {format_last_triggered(last_triggered)}"
+            + (f", {suppressed} skipped by cooldown" if suppressed else "")
+            for (hits, last_triggered, suppressed), exp in fired[:STATS_TOP]
+        ]
+        never_lines = [f"`{exp.id}` | {exp.trigger_type} | {exp.created_by}" for exp in never[:STATS_TOP]]
+        if len(never) > STATS_TOP:
+            never_lines.append(f"...and {len(never) - STATS_TOP} more")
+
+        embed = discord.Embed(
+            title="Expression Stats",
+            description=f"{len(fired)} of {len(totals)} expressions have triggered at least once.",
+            colour=embed_color,
+            timestamp=datetime.now()
+        )
+        embed.add_field(name="Most Triggered", value="\n".join(top_lines)[:1024] or "None yet", inline=False)
+        embed.add_field(name="Never Triggered", value="\n".join(never_lines)[:1024] or "None", inline=False)
+        embed.set_footer(text=footer_text, icon_url=icon)
+        await interaction.response.send_message(embed=embed, ephemeral=False)
+
+    def list_custom_id(guild_id, page, filters):
+        # Everything a click needs is in the custom_id, so no view is kept in memory
+        trigger_type, creator, text = filters
+        return f"{LIST_PREFIX}|{guild_id}|{page}|{trigger_type}|{creator}|{text}"[:100]
+
+    def parse_list_custom_id(custom_id):
+        _, guild_id, page, trigger_type, creator, text = custom_id.split("|", 5)
+        return int(guild_id), page, (trigger_type, creator, text)
+
+    def filter_expressions(expressions, filters):
+        trigger_type, creator, text = filters
+        if not (trigger_type or creator or text):
+            return expressions
+        text = text.casefold()
+        return [
+            exp for exp in expressions
+            if (not trigger_type or exp.trigger_type == trigger_type)
+            and (not creator or exp.created_by == creator)
+            and (not text or text in (exp.folded or str(exp.trigger)) or text in exp.response.casefold())
+        ]
 
-            if self.page > 0:
-                left_button = Button(label="⬅️", style=discord.ButtonStyle.primary)
-                left_button.callback = self.left_callback
-                self.add_item(left_button)
+    def make_list_page(guild_id, expressions, page, filters):
+        matching = filter_expressions(expressions, filters)
+        last_page = max(0, (len(matching) - 1) // LIST_PAGE_SIZE)
+        page = min(max(page, 0), last_page)
+        start = page * LIST_PAGE_SIZE
+        end = min(start + LIST_PAGE_SIZE, len(matching))
+        current_expressions = matching[start:end]
 
-            if end < len(self.expressions):
-                right_button = Button(label="➡️", style=discord.ButtonStyle.primary)
-                right_button.callback = self.right_callback
-                self.add_item(right_button)
+        embed = discord.Embed(
+            title="Expression List",
+            colour=embed_color,
+            timestamp=datetime.now()
+        )
 
-        def create_embed(self):
-            start = self.page * 10
-            end = min(start + 10, len(self.expressions))
-            current_expressions = self.expressions[start:end]
+        expression_lines = []
+        for exp in current_expressions:
+            truncated_response = (exp.response[:10] + "...") if len(exp.response) > 10 else exp.response
+            expression_lines.append(f"{exp.id} | {exp.trigger_type} | {truncated_response} | {exp.created_by}")
 
-            embed = discord.Embed(
-                title="Expression List",
-                colour=embed_color,
-                timestamp=datetime.now()
-            )
+        embed.add_field(
+            name="ID | Type | Response | Creator",
+            value="\n".join(expression_lines) or "No expressions match these filters.",
+            inline=False
+        )
 
-            expression_lines = []
-            for exp in current_expressions:
-                truncated_response = (exp["response"][:10] + "...") if len(exp["response"]) > 10 else exp["response"]
-                expression_lines.append(f"{exp['id']} | {exp['trigger_type']} | {truncated_response} | {exp['created_by']}")
+        embed.set_footer(
+            text=f"Showing {start + 1 if current_expressions else 0}-{end}/{len(matching)}",
+            icon_url=icon
+        )
 
-            embed.add_field(
-                name="ID | Type | Response | Creator",
-                value="\n".join(expression_lines),
-                inline=False
+        # Never stored in the view store, clicks are handled by on_list_interaction
+        view = View(timeout=None)
+        if current_expressions:
+            select = Select(
+                custom_id=list_custom_id(guild_id, "select", filters),
+                placeholder="Select an expression by ID",
+                min_values=1,
+                max_values=1
             )
+            for exp in current_expressions:
+                select.add_option(label=exp.id, value=exp.id)
+            view.add_item(select)
+
+        if page > 0:
+            view.add_item(Button(
+                label="⬅️", style=discord.ButtonStyle.primary,
+                custom_id=list_custom_id(guild_id, page - 1, filters)
+            ))
+
+        if end < len(matching):
+            view.add_item(Button(
+                label="➡️", style=discord.ButtonStyle.primary,
+                custom_id=list_custom_id(guild_id, page + 1, filters)
+            ))
+        view.stop()
+        return embed, view
+
+    @bot.listen("on_interaction")
+    async def on_list_interaction(interaction: discord.Interaction):
+        if interaction.type != discord.InteractionType.component:
+            return
+        custom_id = interaction.data.get("custom_id", "")
+        if not custom_id.startswith(LIST_PREFIX + "|"):
+            return
 
-            embed.set_footer(
-                text=f"Showing {start + 1}-{end}/{len(self.expressions)}",
-                icon_url=icon
-            )
-            return embed
+        guild_id, page, filters = parse_list_custom_id(custom_id)
+        if not interaction.guild or interaction.guild.id != guild_id:
+            await interaction.response.send_message("This list belongs to another server.", ephemeral=True)
+            return
+
+        age = (discord.utils.utcnow() - interaction.message.created_at).total_seconds()
+        if age > LIST_TTL:
+            await interaction.response.send_message("This list has expired, run /expression_list again.", ephemeral=True)
+            return
 
-        async def select_callback(self, interaction: discord.Interaction):
-            selected_id = interaction.data["values"][0]
-            expression = next((exp for exp in self.expressions if exp["id"] == selected_id), None)
+        server_data = await store.load(guild_id)
+        if page == "select":
+            index = await store.load_index(guild_id)
+            expression = index.expressions.get(interaction.data["values"][0])
             if expression:
-                trigger = expression["trigger"]
-                if expression["trigger_type"] == "user":
-                    trigger = f"<@{trigger}>"
-
-                embed = discord.Embed(
-                    title=f"Expression Details - {expression['id']}",
-                    colour=embed_color,
-                    timestamp=datetime.now()
-                )
-                embed.add_field(name="Trigger Type", value=expression["trigger_type"], inline=True)
-                embed.add_field(name="Trigger", value=trigger, inline=True)
-                embed.add_field(name="Action", value=expression["action"], inline=True)
-                embed.add_field(name="Response", value=expression["response"], inline=True)
-                embed.add_field(name="Cooldown", value=f"{expression['cooldown']} minutes", inline=True)
-                embed.add_field(name="Created By", value=expression["created_by"], inline=True)
-                embed.set_footer(text=footer_text, icon_url=icon)
-
-                await interaction.response.send_message(embed=embed, ephemeral=True)
+                totals = event_handlers.stats.totals(guild_id, expression)
+                await interaction.response.send_message(embed=make_expression_embed(expression, totals), ephemeral=True)
             else:
                 await interaction.response.send_message("Expression not found.", ephemeral=True)
+            return
 
-        async def left_callback(self, interaction: discord.Interaction):
-            self.page -= 1
-            self.update_view()
-            embed = self.create_embed()
-            await interaction.response.edit_message(embed=embed, view=self)
-
-        async def right_callback(self, interaction: discord.Interaction):
-            self.page += 1
-            self.update_view()
-            embed = self.create_embed()
-            await interaction.response.edit_message(embed=embed, view=self)
+        embed, view = make_list_page(guild_id, list(server_data["expressions"].values()), int(page), filters)
+        await interaction.response.edit_message(embed=embed, view=view)
 
 
     @bot.tree.command(name="expression_list", description="Show a list of all expressions on the server")
-    async def expression_list(interaction: discord.Interaction):
-        guild_id = str(interaction.guild.id)
-        server_data = load_expressions(guild_id)
-        expressions = server_data.get("expressions", [])
+    @app_commands.describe(
+        trigger_type="Only show this trigger type",
+        creator="Only show expressions created by this user name",
+        text="Only show expressions whose trigger or response contains this text"
+    )
+    async def expression_list(
+        interaction: discord.Interaction,
+        trigger_type: str = None,
+        creator: str = None,
+        text: str = None
+    ):
+        guild_id = interaction.guild.id
+        server_data = await store.load(guild_id)
+        expressions = list(server_data["expressions"].values())
 
         if not expressions:
             await interaction.response.send_message("No expressions found on this server.", ephemeral=False)
             return
 
-        view = ExpressionListView(interaction, expressions)
-        embed = view.create_embed()
+        trigger_type = (trigger_type or "").lower()
+        if trigger_type and trigger_type not in TRIGGER_TYPES:
+            await interaction.response.send_message(f"Unknown trigger type, use one of: {', '.join(TRIGGER_TYPES)}.", ephemeral=True)
+            return
+
+        # The filters travel in the 100 character custom_id. "|" separates its fields,
+        # the text filter is the last one so only that one may contain it.
+        filters = (trigger_type, (creator or "").replace("|", "")[:32], (text or "")[:24])
+        embed, view = make_list_page(guild_id, expressions, 0, filters)
         await interaction.response.send_message(embed=embed, view=view, ephemeral=False)
 
+    @expression_list.autocomplete("trigger_type")
+    async def list_trigger_type_autocomplete(interaction: discord.Interaction, current: str):
+        return [
+            app_commands.Choice(name="User", value="user"),
+            app_commands.Choice(name="Phrase", value="phrase"),
+            app_commands.Choice(name="Word", value="word"),
+            app_commands.Choice(name="Regex", value="regex")
+        ]
+
+
+    @bot.tree.command(name="expression_export", description="Download the server's expressions as a JSON or CSV file")
+    @app_commands.describe(file_format="json, jsonl or csv")
+    async def expression_export(interaction: discord.Interaction, file_format: str = "json"):
+        if not interaction.user.guild_permissions.administrator:
+            await interaction.response.send_message("You don't have permission to use this.", ephemeral=True)
+            return
+        file_format = file_format.lower()
+        if file_format not in FORMATS:
+            await interaction.response.send_message(f"Unknown format, use one of: {', '.join(FORMATS)}.", ephemeral=True)
+            return
+
+        guild_id = interaction.guild.id
+        server_data = await store.load(guild_id)
+        expressions = [exp.to_dict() for exp in server_data["expressions"].values()]
+
+        # Small exports stay in memory, big ones spill over to a temp file
+        file = tempfile.SpooledTemporaryFile(max_size=MAX_IMPORT_SIZE)
+        def write():
+            text = io.TextIOWrapper(file, encoding="utf-8", newline="")
+            write_export(expressions, file_format, text)
+            text.flush()
+            text.detach()
+            file.seek(0)
+        await asyncio.to_thread(write)
+
+        await interaction.response.send_message(
+            f"Exported {len(expressions)} expressions.",
+            file=discord.File(file, filename=f"expressions-{guild_id}.{file_format}"),
+            ephemeral=True
+        )
+
+    @expression_export.autocomplete("file_format")
+    async def export_format_autocomplete(interaction: discord.Interaction, current: str):
+        return [app_commands.Choice(name=fmt.upper(), value=fmt) for fmt in FORMATS]
+
+    @bot.tree.command(name="expression_import", description="Add expressions from a JSON or CSV file")
+    @app_commands.describe(
+        file="A .json, .jsonl or .csv file, like the ones /expression_export makes",
+        replace="Replace all of the server's expressions instead of adding to them"
+    )
+    async def expression_import(interaction: discord.Interaction, file: discord.Attachment, replace: bool = False):
+        if not interaction.user.guild_permissions.administrator:
+            await interaction.response.send_message("You don't have permission to use this.", ephemeral=True)
+            return
+        file_format = guess_format(file.filename)
+        if file_format is None:
+            await interaction.response.send_message(f"Unknown file type, use one of: {', '.join(FORMATS)}.", ephemeral=True)
+            return
+        if file.size > MAX_IMPORT_SIZE:
+            await interaction.response.send_message(f"The file can be at most {MAX_IMPORT_SIZE // 2**20} MB.", ephemeral=True)
+            return
+
+        await interaction.response.defer(ephemeral=True)
+        try:
+            text = (await file.read()).decode("utf-8-sig")
+        except (discord.HTTPException, UnicodeDecodeError) as e:
+            await interaction.followup.send(f"Couldn't read the file: {e}", ephemeral=True)
+            return
+
+        guild_id = str(interaction.guild.id)
+        server_data = await store.load(guild_id)
+        taken = set() if replace else set(server_data["expressions"])
+        # Up to MAX_IMPORT_ROWS rows with regexes to compile, off the event loop
+        expressions, errors = await asyncio.to_thread(
+            validate_rows, read_rows(text, file_format), taken, str(interaction.user)
+        )
+        if errors:
+            await interaction.followup.send(
+                "Nothing was imported, fix these first:\n" + "\n".join(errors), ephemeral=True
+            )
+            return
+
+        if not server_data["info"]:
+            server_data["info"] = {
+                "id": guild_id,
+                "name": interaction.guild.name,
+                "invited_at": str(interaction.guild.me.joined_at)
+            }
+        apply_import(server_data, expressions, replace)
+        drop_index(guild_id)
+        await store.save(guild_id, server_data)
+        log_message = (
+            f"**Expressions Imported**\n"
+            f"**Count:** {len(expressions)}\n"
+            f"**Importer:** {interaction.user}\n"
+            f"**Replaced existing:** {'yes' if replace else 'no'}"
+        )
+        await send_log(interaction, "log_create", log_message)
+        await interaction.followup.send(f"Imported {len(expressions)} expressions.", ephemeral=True)
+
 
     @bot.tree.command(name="expression_role", description="Set who can manage expressions (Admins, Everyone, or a specific role)")
     async def expression_role(interaction: discord.Interaction):
@@ -398,7 +638,7 @@ def setup(bot):
             return
 
         guild_id = str(interaction.guild.id)
-        server_data = load_expressions(guild_id)
+        server_data = await store.load(guild_id)
 
         expression_perms = server_data["info"].get("expression_perms", {"type": "admin", "role_id": None})
 
@@ -435,14 +675,15 @@ def setup(bot):
             return
 
         guild_id = str(interaction.guild.id)
-        server_data = load_expressions(guild_id)
+        server_data = await store.load(guild_id)
         if "expression_logs" not in server_data["info"]:
             server_data["info"]["expression_logs"] = {
                 "channel_id": None,
                 "log_create": True,
                 "log_edit": True,
                 "log_delete": True,
-                "log_trigger": True
+                # Not log_trigger, older versions stored that as True for every guild without it doing anything
+                "log_triggered": False
             }
 
         await interaction.response.send_message(
@@ -451,6 +692,59 @@ def setup(bot):
             ephemeral=False
         )
     
+    @bot.tree.command(name="expression_throttle", description="Limit how often one member or channel can trigger expressions")
+    @app_commands.describe(
+        user_per_minute="Messages per minute a member's messages are checked for triggers, 0 for no limit",
+        user_burst="Messages a member can send at once before the limit applies",
+        channel_per_minute="Messages per minute a channel's messages are checked for triggers, 0 for no limit",
+        channel_burst="Messages a channel can get at once before the limit applies"
+    )
+    async def expression_throttle(
+        interaction: discord.Interaction,
+        user_per_minute: app_commands.Range[int, 0, 600] = None,
+        user_burst: app_commands.Range[int, 1, 100] = None,
+        channel_per_minute: app_commands.Range[int, 0, 3000] = None,
+        channel_burst: app_commands.Range[int, 1, 500] = None
+    ):
+        if not interaction.user.guild_permissions.administrator:
+            await interaction.response.send_message("You don't have permission to use this.", ephemeral=True)
+            return
+
+        guild_id = str(interaction.guild.id)
+        server_data = await store.load(guild_id)
+        changes = {
+            key: value for key, value in (
+                ("user_per_minute", user_per_minute),
+                ("user_burst", user_burst),
+                ("channel_per_minute", channel_per_minute),
+                ("channel_burst", channel_burst)
+            ) if value is not None
+        }
+        if changes:
+            settings = server_data["info"].setdefault("throttles", {})
+            settings.update(changes)
+            event_handlers.throttle.configure(interaction.guild.id, settings)
+            await store.save(guild_id, server_data)
+
+        settings = {**event_handlers.throttle.defaults, **server_data["info"].get("throttles", {})}
+        def describe(kind):
+            if not settings[f"{kind}_per_minute"]:
+                return "no limit"
+            return f"{settings[f'{kind}_per_minute']} messages a minute, bursts of {settings[f'{kind}_burst']}"
+
+        embed = discord.Embed(
+            title="Expression Throttle Settings",
+            description=(
+                "Messages over these limits aren't checked for triggers at all.\n\n"
+                f"**Per member:** {describe('user')}\n"
+                f"**Per channel:** {describe('channel')}"
+            ),
+            colour=embed_color,
+            timestamp=datetime.now()
+        )
+        embed.set_footer(text=footer_text, icon_url=icon)
+        await interaction.response.send_message(embed=embed, ephemeral=not changes)
+
     class ExpressionRoleView(View):
         def __init__(self, interaction: discord.Interaction, server_data):
             super().__init__(timeout=60)
@@ -469,13 +763,13 @@ def setup(bot):
         @discord.ui.button(label="Admins only", style=discord.ButtonStyle.primary)
         async def admin_button(self, interaction: discord.Interaction, button: Button):
             self.server_data["info"]["expression_perms"] = {"type": "admin", "role_id": None}
-            save_expressions(str(interaction.guild.id), self.server_data)
+            await store.save(str(interaction.guild.id), self.server_data)
             await self.update_embed(interaction, "Admins only")
 
         @discord.ui.button(label="Everyone", style=discord.ButtonStyle.primary)
         async def everyone_button(self, interaction: discord.Interaction, button: Button):
             self.server_data["info"]["expression_perms"] = {"type": "everyone", "role_id": None}
-            save_expressions(str(interaction.guild.id), self.server_data)
+            await store.save(str(interaction.guild.id), self.server_data)
             await self.update_embed(interaction, "Everyone")
 
         @discord.ui.button(label="Tag Role", style=discord.ButtonStyle.primary)
@@ -493,7 +787,7 @@ def setup(bot):
                 message = await interaction.client.wait_for("message", check=check, timeout=30)
                 role = message.role_mentions[0]
                 self.server_data["info"]["expression_perms"] = {"type": "role", "role_id": role.id}
-                save_expressions(str(interaction.guild.id), self.server_data)
+                await store.save(str(interaction.guild.id), self.server_data)
                 await message.reply(f"Expression permissions set to @{role.name}.", ephemeral=False)
             except asyncio.TimeoutError:
                 await interaction.followup.send("You took too long to respond. Please try again.", ephemeral=True)
@@ -522,7 +816,7 @@ def setup(bot):
             f"**➕ Created New Expression:** {'ON ✅' if logs['log_create'] else 'OFF ❌'}",
             f"**📝 Edited Expression:** {'ON ✅' if logs['log_edit'] else 'OFF ❌'}",
             f"**🚫 Deleted Expression:** {'ON ✅' if logs['log_delete'] else 'OFF ❌'}",
-            # f"**‼️ Expression Triggered:** {'ON ✅' if logs['log_trigger'] else 'OFF ❌'}",    # CURRENTLY DOESNT WORK!!!!
+            f"**‼️ Expression Triggered:** {'ON ✅' if logs.get('log_triggered') else 'OFF ❌'}",
             "",
             "Use the buttons below to toggle each option or set a new channel."
         ]
@@ -538,25 +832,8 @@ def setup(bot):
 
 
     async def send_log(interaction: discord.Interaction, log_type: str, log_message: str):
-        guild_id = str(interaction.guild.id)
-        server_data = load_expressions(guild_id)
-        logs = server_data["info"].get("expression_logs", {})
-        channel_id = logs.get("channel_id")
-
-        if not logs.get(log_type, False):
-            return
-
-        if channel_id:
-            channel = interaction.guild.get_channel(channel_id)
-            if channel:
-                embed = discord.Embed(
-                    title="Expression Log",
-                    description=log_message,
-                    colour=embed_color,
-                    timestamp=datetime.now()
-                )
-                embed.set_footer(text=footer_text, icon_url=icon)
-                await channel.send(embed=embed)
+        server_data = await store.load(interaction.guild.id)
+        queue_log(interaction.guild, server_data, log_type, log_message)
 
 
     class ExpressionLogsView(View):
@@ -581,30 +858,29 @@ def setup(bot):
         async def toggle_create(self, interaction: discord.Interaction, button: Button):
             logs = self.server_data["info"]["expression_logs"]
             logs["log_create"] = not logs["log_create"]
-            save_expressions(str(interaction.guild.id), self.server_data)
+            await store.save(str(interaction.guild.id), self.server_data)
             await self.update_message(interaction)
 
         @discord.ui.button(label="📝", style=discord.ButtonStyle.primary)
         async def toggle_edit(self, interaction: discord.Interaction, button: Button):
             logs = self.server_data["info"]["expression_logs"]
             logs["log_edit"] = not logs["log_edit"]
-            save_expressions(str(interaction.guild.id), self.server_data)
+            await store.save(str(interaction.guild.id), self.server_data)
             await self.update_message(interaction)
 
         @discord.ui.button(label="🚫", style=discord.ButtonStyle.primary)
         async def toggle_delete(self, interaction: discord.Interaction, button: Button):
             logs = self.server_data["info"]["expression_logs"]
             logs["log_delete"] = not logs["log_delete"]
-            save_expressions(str(interaction.guild.id), self.server_data)
+            await store.save(str(interaction.guild.id), self.server_data)
             await self.update_message(interaction)
 
-        """@discord.ui.button(label="‼️", style=discord.ButtonStyle.primary)
+        @discord.ui.button(label="‼️", style=discord.ButtonStyle.primary)
         async def toggle_trigger(self, interaction: discord.Interaction, button: Button):
             logs = self.server_data["info"]["expression_logs"]
-            logs["log_trigger"] = not logs["log_trigger"]
-            save_expressions(str(interaction.guild.id), self.server_data)
-            await self.update_message(interaction)"""
-        ## CURRENTLY DOESNT WORK!!!!
+            logs["log_triggered"] = not logs.get("log_triggered", False)
+            await store.save(str(interaction.guild.id), self.server_data)
+            await self.update_message(interaction)
 
         @discord.ui.button(label="Change Channel", style=discord.ButtonStyle.secondary)
         async def change_channel(self, interaction: discord.Interaction, button: Button):
@@ -621,7 +897,7 @@ def setup(bot):
                 msg = await interaction.client.wait_for("message", check=check, timeout=30)
                 channel_id = msg.channel_mentions[0].id
                 self.server_data["info"]["expression_logs"]["channel_id"] = channel_id
-                save_expressions(str(interaction.guild.id), self.server_data)
+                await store.save(str(interaction.guild.id), self.server_data)
                 await interaction.followup.send(f"Expression logs channel set to <#{channel_id}>.", ephemeral=False)
             except asyncio.TimeoutError:
                 await interaction.followup.send("You took too long to respond. Please try again.", ephemeral=True)
@@ -0,0 +1,231 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import re
+
+import metrics
+from dispatcher import action_bucket
+
+logger = logging.getLogger(__name__)
+
+MAX_STEPS = 20          # compiled steps in one plan
+MAX_TEXT = 2000         # characters in a send or reply step, Discord's message limit
+MAX_WAIT = 600          # seconds one wait step may take
+MAX_TOTAL_WAIT = 3600   # seconds all wait steps together may take
+MAX_PLANS = 1000        # plans in flight at once, across all guilds
+MAX_GUILD_PLANS = 50    # plans in flight at once in one guild, so one guild can't take them all
+
+ACTIONS = ("send", "reply", "react")
+
+_separator = re.compile(r"(?<!\\);|\n")
+_condition = re.compile(
+    r"(?P<kind>chance)\s+(?P<percent>\d{1,3})%?"
+    r"|(?P<target>user|channel)\s+(?:<[@#]!?)?(?P<id>\d+)>?"
+    r"|contains\s+(?:\"(?P<quoted>[^\"]+)\"|(?P<word>\S+))",
+    re.IGNORECASE
+)
+
+
+def _compile_step(text, plan):
+    keyword, _, rest = text.strip().partition(" ")
+    keyword = keyword.lower()
+    rest = rest.strip()
+
+    if keyword in ACTIONS:
+        if not rest:
+            raise ValueError(f"`{keyword}` needs something to {keyword}.")
+        if len(rest) > MAX_TEXT:
+            raise ValueError(f"`{keyword}` text can be at most {MAX_TEXT} characters long.")
+        plan.append((keyword, rest.replace("\\;", ";"), None))
+    elif keyword == "wait":
+        try:
+            seconds = float(rest.rstrip("s"))
+        except ValueError:
+            raise ValueError(f"`wait` needs a number of seconds, not `{rest}`.")
+        if not 0 < seconds <= MAX_WAIT:
+            raise ValueError(f"`wait` has to be between 0 and {MAX_WAIT} seconds.")
+        plan.append(("wait", seconds, None))
+    elif keyword == "if":
+        match = _condition.match(rest)
+        if not match:
+            raise ValueError("`if` needs a condition: `chance 50`, `contains word`, `user ID` or `channel ID`.")
+        if match.group("kind"):
+            percent = int(match.group("percent"))
+            if percent > 100:
+                raise ValueError("`chance` is a percentage, at most 100.")
+            condition = ("chance", percent / 100)
+        elif match.group("target"):
+            condition = (match.group("target").lower(), int(match.group("id")))
+        else:
+            condition = ("contains", (match.group("quoted") or match.group("word")).casefold())
+        if not rest[match.end():].strip():
+            raise ValueError("`if` needs a step to run after its condition.")
+
+        # Jumps past the guarded step when the condition is false
+        position = len(plan)
+        plan.append(None)
+        _compile_step(rest[match.end():], plan)
+        plan[position] = ("if", condition, len(plan))
+    else:
+        raise ValueError(f"Unknown step `{keyword}`, use send, reply, react, wait or if.")
+
+
+def compile_plan(script):
+    # Turns a script like "send Hi; wait 5; if chance 50 react 👍" into a tuple of
+    # (op, argument, jump target) steps. Raises ValueError with a message for the user.
+    plan = []
+    for text in _separator.split(script):
+        if text.strip():
+            _compile_step(text, plan)
+    if not plan:
+        raise ValueError("A compound expression needs at least one step.")
+    if len(plan) > MAX_STEPS:
+        raise ValueError(f"A compound expression can have at most {MAX_STEPS} steps.")
+    if sum(argument for op, argument, _ in plan if op == "wait") > MAX_TOTAL_WAIT:
+        raise ValueError(f"All waits together can be at most {MAX_TOTAL_WAIT} seconds.")
+    if not any(op in ACTIONS for op, _, _ in plan):
+        raise ValueError("A compound expression needs at least one send, reply or react step.")
+    return tuple(plan)
+
+
+def plan_error(script):
+    try:
+        compile_plan(script)
+    except ValueError as e:
+        return str(e)
+    return None
+
+
+class _Run:
+    # One triggered plan. Only what later steps need is kept, the full message is
+    # swapped for a partial one before the first wait.
+    __slots__ = ("plan", "step", "message", "guild_id", "author_id", "content")
+
+    def __init__(self, plan, message):
+        self.plan = plan
+        self.step = 0
+        self.message = message
+        self.guild_id = message.guild.id
+        self.author_id = message.author.id
+        self.content = message.content.casefold() if any(step[0] == "if" for step in plan) else None
+
+
+class PlanScheduler:
+    # Runs compiled plans without a task per plan or per step. Action steps go
+    # through the ActionDispatcher and continue the plan when their call is done;
+    # wait steps go into one heap of due times served by a single loop timer.
+
+    def __init__(self, dispatcher, handle_action, max_plans=MAX_PLANS, max_guild_plans=MAX_GUILD_PLANS):
+        self.dispatcher = dispatcher
+        self.handle_action = handle_action
+        self.max_plans = max_plans
+        self.max_guild_plans = max_guild_plans
+        self.running = 0
+        self._guilds = {}       # guild id -> plans in flight there
+        self._timers = []       # (due time, sequence, run)
+        self._sequence = itertools.count()
+        self._timer = None      # loop timer for the earliest entry in _timers
+        self._timer_due = None
+
+    def start(self, plan, message):
+        # Returns False when too many plans are in flight, in total or in the guild
+        if self.running >= self.max_plans:
+            metrics.responses_dropped.inc("plans")
+            return False
+        guild_id = message.guild.id
+        in_guild = self._guilds.get(guild_id, 0)
+        if in_guild >= self.max_guild_plans:
+            metrics.responses_dropped.inc("guild_plans")
+            return False
+        self._guilds[guild_id] = in_guild + 1
+        self.running += 1
+        metrics.plans_running.set(self.running)
+        self._advance(_Run(plan, message))
+        return True
+
+    def _finish(self, run):
+        run.message = None
+        in_guild = self._guilds.pop(run.guild_id) - 1
+        if in_guild:
+            self._guilds[run.guild_id] = in_guild
+        self.running -= 1
+        metrics.plans_running.set(self.running)
+
+    def _advance(self, run):
+        plan = run.plan
+        while run.step < len(plan):
+            op, argument, target = plan[run.step]
+            run.step += 1
+            if op == "if":
+                if not self._check(argument, run):
+                    run.step = target
+            elif op == "wait":
+                self._sleep(run, argument)
+                return
+            else:
+                bucket = action_bucket(op, run.message.channel.id)
+                if not self.dispatcher.submit(bucket, self._act, run, op, argument, on_drop=self._dropped):
+                    self._finish(run)
+                return
+        self._finish(run)
+
+    async def _act(self, run, action, response):
+        try:
+            await self.handle_action(run.message, action, response)
+        finally:
+            self._advance(run)
+
+    def _dropped(self, run, action, response):
+        self._finish(run)
+
+    def _check(self, condition, run):
+        kind, value = condition
+        if kind == "chance":
+            return random.random() < value
+        if kind == "user":
+            return run.author_id == value
+        if kind == "channel":
+            return run.message.channel.id == value
+        return value in run.content
+
+    def _sleep(self, run, seconds):
+        # Enough to send, reply and react, without holding on to the whole message
+        run.message = run.message.channel.get_partial_message(run.message.id)
+        loop = asyncio.get_running_loop()
+        due = loop.time() + seconds
+        heapq.heappush(self._timers, (due, next(self._sequence), run))
+        if self._timer_due is None or due < self._timer_due:
+            self._arm(loop, due)
+
+    def _arm(self, loop, due):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = loop.call_at(due, self._wake, loop)
+        self._timer_due = due
+
+    def _wake(self, loop):
+        self._timer = None
+        self._timer_due = None
+        now = loop.time()
+        timers = self._timers
+        while timers and timers[0][0] <= now:
+            run = heapq.heappop(timers)[2]
+            try:
+                self._advance(run)
+            except Exception as e:
+                logger.error(f"Failed to continue a compound expression: {e}")
+                self._finish(run)
+        if timers:
+            self._arm(loop, timers[0][0])
+
+    def close(self):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = None
+        self._timer_due = None
+        self._timers.clear()
+        self._guilds.clear()
+        self.running = 0
+
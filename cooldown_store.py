@@ -0,0 +1,77 @@
+import heapq
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class CooldownStore:
+    # Expression cooldowns keyed by (guild_id, expression_id). Expiry times come
+    # from the caller's monotonic clock (the event loop's time). A min-heap of
+    # expiry times lets expired entries be dropped without scanning the dict.
+
+    def __init__(self):
+        self._expiry = {}   # key -> expiry time
+        self._heap = []     # (expiry time, key), may hold stale entries for re-armed keys
+
+    def __len__(self):
+        return len(self._expiry)
+
+    def remaining(self, key, now):
+        expiry = self._expiry.get(key)
+        if expiry is None:
+            return 0
+        return expiry - now
+
+    def start(self, key, now, seconds):
+        self.expire(now)
+        if seconds <= 0:
+            self._expiry.pop(key, None)
+            return
+        expiry = now + seconds
+        self._expiry[key] = expiry
+        heapq.heappush(self._heap, (expiry, key))
+
+    def expire(self, now):
+        heap = self._heap
+        expiry = self._expiry
+        while heap and heap[0][0] <= now:
+            when, key = heapq.heappop(heap)
+            if expiry.get(key) == when:
+                del expiry[key]
+
+        # Re-armed keys leave stale heap entries behind, compact once they dominate
+        if len(heap) > 2 * len(expiry) + 1024:
+            self._heap = [(when, key) for key, when in expiry.items()]
+            heapq.heapify(self._heap)
+
+    def save_snapshot(self, path, now):
+        # Stored as wall clock times, the monotonic clock does not survive a restart
+        offset = time.time() - now
+        entries = [
+            [guild_id, expression_id, when + offset]
+            for (guild_id, expression_id), when in self._expiry.items() if when > now
+        ]
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump(entries, file, separators=(",", ":"))
+        os.replace(temp_path, path)
+
+    def load_snapshot(self, path, now):
+        try:
+            with open(path, "r") as file:
+                entries = json.load(file)
+        except FileNotFoundError:
+            return
+        except json.JSONDecodeError as e:
+            logger.error(f"Ignoring unreadable cooldown snapshot {path}: {e}")
+            return
+
+        offset = time.time() - now
+        for guild_id, expression_id, wall_expiry in entries:
+            remaining = wall_expiry - offset - now
+            if remaining > 0:
+                self.start((guild_id, expression_id), now, remaining)
+        logger.info(f"Restored {len(self)} cooldowns from {path}.")
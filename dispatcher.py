@@ -0,0 +1,89 @@
+import asyncio
+import collections
+import logging
+import metrics
+
+logger = logging.getLogger(__name__)
+
+WORKERS = 8             # REST calls in flight at once, across all channels
+QUEUE_SIZE = 20         # pending responses per bucket before new ones are dropped
+MAX_PENDING = 2000      # pending responses across all buckets
+STALE_AFTER = 10.0      # seconds after which a queued response is no longer worth sending
+BATCH = 5               # responses a worker sends from one bucket before letting others go
+
+
+def action_bucket(action, channel_id):
+    return ("react" if action == "react" else "message", channel_id)
+
+
+class ActionDispatcher:
+    # Runs expression responses off the message handler. Work is queued per
+    # bucket, e.g. ("message", channel_id) or ("react", channel_id), matching
+    # Discord's per-channel rate limit routes. One worker serves a bucket at a
+    # time so its calls stay in order, while different buckets run concurrently
+    # on a fixed number of workers.
+
+    def __init__(self, workers=WORKERS):
+        self.workers = workers
+        self.pending = 0
+        self._queues = {}       # bucket -> deque of (enqueued_at, func, args, on_drop)
+        self._ready = None      # buckets with work and no worker
+        self._tasks = []
+
+    def _start(self):
+        self._ready = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def submit(self, bucket, func, *args, on_drop=None):
+        # Queue func(*args), returns False when the work was dropped. If it is
+        # dropped later for being stale, on_drop(*args) is called instead.
+        if not self._tasks:
+            self._start()
+
+        queue = self._queues.get(bucket)
+        if self.pending >= MAX_PENDING or (queue is not None and len(queue) >= QUEUE_SIZE):
+            metrics.responses_dropped.inc("full")
+            return False
+
+        if queue is None:
+            queue = self._queues[bucket] = collections.deque()
+            self._ready.put_nowait(bucket)
+        queue.append((asyncio.get_running_loop().time(), func, args, on_drop))
+        self.pending += 1
+        return True
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            bucket = await self._ready.get()
+            queue = self._queues[bucket]
+            served = 0
+            while queue and served < BATCH:
+                enqueued_at, func, args, on_drop = queue.popleft()
+                self.pending -= 1
+                if loop.time() - enqueued_at > STALE_AFTER:
+                    metrics.responses_dropped.inc("stale")
+                    if on_drop is not None:
+                        try:
+                            on_drop(*args)
+                        except Exception as e:
+                            logger.error(f"Failed to drop stale response for {bucket}: {e}")
+                    continue
+                served += 1
+                try:
+                    await func(*args)
+                except Exception as e:
+                    logger.error(f"Failed to dispatch response for {bucket}: {e}")
+
+            if queue:
+                self._ready.put_nowait(bucket)
+            else:
+                del self._queues[bucket]
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queues.clear()
+        self.pending = 0
@@ -1,12 +1,45 @@
 import discord
 import logging
 import asyncio
+import time
 
-from file_handling import load_expressions
+import metrics
+from compound import PlanScheduler
+from cooldown_store import CooldownStore
+from dispatcher import ActionDispatcher, action_bucket
+from expression_logs import queue_log, queue_notice, wants_log
+from expression_stats import ExpressionStats
+from file_handling import store
+from load_shedding import SHED_ALL, SHED_LOW_PRIORITY, SHED_REACTIONS, LoadShedder
+from matcher import PATTERN_STRIKES
+from throttle import Throttle
 
 logger = logging.getLogger(__name__)
 
-cooldowns = {}
+cooldowns = CooldownStore()
+dispatcher = ActionDispatcher()
+shedder = LoadShedder()
+throttle = Throttle()
+stats = ExpressionStats()
+
+
+async def handle_action(message, action, response):
+    started = time.perf_counter()
+    try:
+        if action == "send":
+            await message.channel.send(response)
+        elif action == "reply":
+            await message.reply(response)
+        elif action == "react":
+            await message.add_reaction(response)
+    except discord.HTTPException:
+        metrics.action_failures.inc(action)
+        logger.warning(f"Failed to {action} response: {response}")
+    finally:
+        metrics.action_latency.observe(time.perf_counter() - started, action)
+
+
+plans = PlanScheduler(dispatcher, handle_action)
 
 
 def setup(bot):
@@ -15,44 +48,80 @@ def setup(bot):
         if message.author.bot:
             return
 
-        guild_id = str(message.guild.id)
-        server_data = load_expressions(guild_id)
-        expressions = server_data.get("expressions", [])
+        guild_id = message.guild.id
+        label = metrics.guild_label(guild_id)
+        metrics.messages_seen.inc(label)
+        now = asyncio.get_running_loop().time()
+        hot = shedder.count(guild_id, now)
+        if store.known_empty(guild_id):
+            return
 
-        for expression in expressions:
-            expression_id = expression["id"]
-            trigger_type = expression["trigger_type"]
-            trigger = expression["trigger"]
-            action = expression["action"]
-            response = expression["response"]
-            cooldown = expression["cooldown"]
-
-            cooldown_key = f"{guild_id}-{expression_id}"
-            if cooldown_key in cooldowns:
-                time_left = cooldowns[cooldown_key] - \
-                    asyncio.get_event_loop().time()
-                if time_left > 0:
-                    logger.info(f"Cooldown active for expression {expression_id}: { \
-                                time_left:.2f} seconds remaining.")
-                    continue
+        # When the loop falls behind, drop trigger work so interactions still get answered in time
+        level = shedder.level(now)
+        if level >= SHED_ALL or (
+            level >= SHED_LOW_PRIORITY and shedder.low_priority(guild_id, message.channel.id, hot)
+        ):
+            metrics.shed.inc("message")
+            return
 
-            if trigger_type == "user" and str(message.author.id) == trigger:
-                await handle_action(message, action, response)
-                cooldowns[cooldown_key] = asyncio.get_event_loop().time() + \
-                    (cooldown * 60)
+        limited = throttle.limited(guild_id, message.author.id, message.channel.id, now)
+        if limited:
+            metrics.throttled.inc(limited)
+            return
 
-            elif trigger_type == "phrase" and trigger.lower() in message.content.lower():
-                await handle_action(message, action, response)
-                cooldowns[cooldown_key] = asyncio.get_event_loop().time() + \
-                    (cooldown * 60)
+        server_data = await store.load(guild_id)
+        if not throttle.configured(guild_id):
+            throttle.configure(guild_id, server_data["info"].get("throttles"))
+        index = await store.load_index(guild_id)
+        expressions = index.candidates(message.author.id, message.content)
+        if index.patterns.disabled and not index.patterns.reported:
+            index.patterns.reported = True
+            logger.warning(f"Regex triggers in guild {guild_id} switched off after {PATTERN_STRIKES} slow messages in a row.")
+            queue_notice(message.guild, server_data, (
+                f"**Regex Triggers Switched Off**\n"
+                f"Regex triggers took too long on {PATTERN_STRIKES} messages in a row, so they have been switched off. "
+                f"Word and other triggers still work. Edit or delete the slow regex expressions to turn them back on."
+            ))
+        if not expressions:
+            return
+        metrics.expressions_evaluated.inc(label, len(expressions))
 
-    async def handle_action(message, action, response):
-        if action == "send":
-            await message.channel.send(response)
-        elif action == "reply":
-            await message.reply(response)
-        elif action == "react":
-            try:
-                await message.add_reaction(response)
-            except discord.HTTPException:
-                logger.warning(f"Failed to add reaction: {response}")
+        for expression in expressions:
+            expression_id = expression.id
+            cooldown_key = (guild_id, expression_id)
+            time_left = cooldowns.remaining(cooldown_key, now)
+            if time_left > 0:
+                metrics.cooldown_skips.inc(label)
+                stats.suppressed(guild_id, expression_id)
+                logger.info(f"Cooldown active for expression {expression_id}: {time_left:.2f} seconds remaining.")
+                continue
+
+            action = expression.action
+            if action == "compound":
+                # Scripts that fail to compile were rejected when saved, unless the file was edited by hand
+                if expression.plan is None:
+                    continue
+                if level >= SHED_REACTIONS:
+                    metrics.shed.inc("plan")
+                    continue
+            elif action == "react" and level >= SHED_REACTIONS:
+                metrics.shed.inc("reaction")
+                continue
+            metrics.matches.inc(label)
+            if action == "compound":
+                queued = plans.start(expression.plan, message)
+            else:
+                queued = dispatcher.submit(action_bucket(action, message.channel.id), handle_action, message, action, expression.response)
+            if not queued:
+                # Dropped, so it didn't fire: no cooldown, hit or log
+                continue
+            cooldowns.start(cooldown_key, now, expression.cooldown * 60)
+            stats.hit(guild_id, expression_id, int(time.time()))
+
+            if wants_log(server_data, "log_triggered"):
+                queue_log(message.guild, server_data, "log_triggered", (
+                    f"**Expression Triggered**\n"
+                    f"**ID:** {expression_id}\n"
+                    f"**Author:** {message.author}\n"
+                    f"**Channel:** <#{message.channel.id}>"
+                ))
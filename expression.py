@@ -0,0 +1,133 @@
+import enum
+import sys
+
+from compound import compile_plan
+from matcher import user_trigger
+
+FIELDS = ("id", "trigger_type", "trigger", "action", "response", "cooldown", "created_by")
+STATS_FIELDS = ("hits", "last_triggered", "suppressed")
+
+
+class TriggerType(str, enum.Enum):
+    USER = "user"
+    PHRASE = "phrase"
+    WORD = "word"
+    REGEX = "regex"
+
+    def __str__(self):
+        return self.value
+
+    __format__ = str.__format__
+
+
+class Action(str, enum.Enum):
+    SEND = "send"
+    REPLY = "reply"
+    REACT = "react"
+    COMPOUND = "compound"
+
+    def __str__(self):
+        return self.value
+
+    __format__ = str.__format__
+
+
+def _member(kind, value):
+    # Unknown values from hand-edited files are kept as they are, so saving doesn't lose them
+    try:
+        return kind(value)
+    except ValueError:
+        return sys.intern(str(value))
+
+
+class Expression:
+    # In-memory form of one expression. Compared to the JSON dict it needs no
+    # per-instance dict, shares the trigger type and action members, keeps user
+    # triggers as ints and has the case-folded trigger ready for matching.
+    # Compound responses are compiled into plan once, None when the script is invalid.
+    # Keys the bot doesn't know about are kept in extra and written back as they were.
+    # The stats fields are only written once the expression has fired or been held
+    # back by its cooldown, see expression_stats.
+
+    __slots__ = ("id", "trigger_type", "trigger", "folded", "action", "response", "plan", "cooldown",
+                 "created_by", "extra", "hits", "last_triggered", "suppressed")
+
+    def __init__(self, id, trigger_type, trigger, action, response, cooldown=0, created_by=None, extra=None,
+                 hits=0, last_triggered=None, suppressed=0):
+        self.id = id
+        self.trigger_type = trigger_type
+        self.trigger = trigger
+        self.action = action
+        self.response = response
+        self.cooldown = cooldown
+        self.created_by = created_by
+        self.extra = extra
+        self.hits = hits
+        self.last_triggered = last_triggered
+        self.suppressed = suppressed
+
+    def __setattr__(self, name, value):
+        # Normalizes on assignment, so reads on the message path stay plain slot reads
+        if name == "trigger_type":
+            value = _member(TriggerType, value)
+        elif name == "action":
+            value = _member(Action, value)
+        elif name == "trigger":
+            if self.trigger_type is TriggerType.USER:
+                user_id = user_trigger(value)
+                value = user_id if user_id is not None else value
+            elif not isinstance(value, str):
+                value = str(value)
+            object.__setattr__(self, "folded", value.casefold() if isinstance(value, str) else None)
+        object.__setattr__(self, name, value)
+        if name == "trigger_type" and hasattr(self, "trigger"):
+            # A user trigger turned into a phrase, or the other way around
+            self.trigger = self.trigger
+        elif name in ("action", "response") and hasattr(self, "response"):
+            object.__setattr__(self, "plan", self._compile())
+
+    def _compile(self):
+        if self.action is not Action.COMPOUND:
+            return None
+        try:
+            return compile_plan(self.response)
+        except ValueError:
+            return None
+
+    @classmethod
+    def from_dict(cls, data):
+        extra = {key: value for key, value in data.items() if key not in FIELDS and key not in STATS_FIELDS}
+        return cls(
+            data["id"],
+            data["trigger_type"],
+            data["trigger"],
+            data["action"],
+            data["response"],
+            data.get("cooldown", 0),
+            data.get("created_by"),
+            extra or None,
+            data.get("hits", 0),
+            data.get("last_triggered"),
+            data.get("suppressed", 0)
+        )
+
+    def to_dict(self):
+        data = {
+            "id": self.id,
+            "trigger_type": str(self.trigger_type),
+            "trigger": self.trigger,
+            "action": str(self.action),
+            "response": self.response,
+            "cooldown": self.cooldown,
+            "created_by": self.created_by
+        }
+        if self.hits or self.suppressed:
+            data["hits"] = self.hits
+            data["last_triggered"] = self.last_triggered
+            data["suppressed"] = self.suppressed
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def __repr__(self):
+        return f"Expression({self.id!r}, {self.trigger_type}, {self.trigger!r})"
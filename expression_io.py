@@ -0,0 +1,211 @@
+# Import and export of a guild's expressions as JSON, JSON lines or CSV. Used by
+# /expression_import and /expression_export, and as an offline CLI:
+#   python expression_io.py export --guild 123 --output expressions.csv
+#   python expression_io.py import --guild 456 --input expressions.csv [--replace]
+# Add --database expressive.db to either one to use the SQLite backend instead of
+# serverdata/. Stop the bot first, it only notices offline changes after a restart.
+
+import argparse
+import csv
+import io
+import json
+import logging
+import re
+
+import file_handling
+from compound import plan_error
+from expression import FIELDS, Action, Expression, TriggerType
+from matcher import new_expression_id, validate_trigger
+
+logger = logging.getLogger(__name__)
+
+TRIGGER_TYPES = tuple(trigger_type.value for trigger_type in TriggerType)
+ACTIONS = tuple(action.value for action in Action)
+FORMATS = ("json", "jsonl", "csv")
+
+MAX_IMPORT_SIZE = 2 * 2**20     # bytes in an uploaded file
+MAX_IMPORT_ROWS = 5000
+MAX_ERRORS = 10                 # validation stops after this many bad rows
+
+
+def guess_format(filename):
+    extension = filename.rsplit(".", 1)[-1].lower()
+    return extension if extension in FORMATS else None
+
+
+def write_export(expressions, fmt, file):
+    # Writes one expression at a time, so the whole file never sits in memory as one string
+    if fmt == "csv":
+        writer = csv.DictWriter(file, fieldnames=FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(expressions)
+    elif fmt == "jsonl":
+        for expression in expressions:
+            file.write(json.dumps(expression, ensure_ascii=False) + "\n")
+    else:
+        file.write("[")
+        for number, expression in enumerate(expressions):
+            file.write(",\n" if number else "\n")
+            file.write(json.dumps(expression, ensure_ascii=False))
+        file.write("\n]\n")
+
+
+def read_rows(text, fmt):
+    # Yields one dict per expression, raises ValueError when the file itself can't be read
+    if fmt == "csv":
+        yield from csv.DictReader(io.StringIO(text))
+    elif fmt == "jsonl":
+        for number, line in enumerate(text.splitlines(), 1):
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError as e:
+                    raise ValueError(f"Line {number} is not valid JSON: {e}")
+    else:
+        try:
+            data = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Not valid JSON: {e}")
+        # A whole guild file works too
+        if isinstance(data, dict):
+            data = data.get("expressions")
+        if not isinstance(data, list):
+            raise ValueError("Expected a list of expressions.")
+        yield from data
+
+
+def parse_row(row, created_by):
+    # Returns (expression, None) or (None, error message)
+    if not isinstance(row, dict):
+        return None, "not an object"
+
+    trigger_type = str(row.get("trigger_type") or "").strip().lower()
+    if trigger_type not in TRIGGER_TYPES:
+        return None, f"trigger_type must be one of {', '.join(TRIGGER_TYPES)}"
+
+    trigger = row.get("trigger")
+    trigger = "" if trigger is None else str(trigger)
+    if trigger_type == "user":
+        match = re.fullmatch(r"\s*(?:<@!?(\d+)>|(\d+))\s*", trigger)
+        if not match:
+            return None, "user triggers need a user ID"
+        trigger = int(match.group(1) or match.group(2))
+    else:
+        error = validate_trigger(trigger_type, trigger)
+        if error:
+            return None, error
+
+    action = str(row.get("action") or "").strip().lower()
+    if action not in ACTIONS:
+        return None, f"action must be one of {', '.join(ACTIONS)}"
+
+    response = row.get("response")
+    if response is None or not str(response).strip():
+        return None, "response can't be empty"
+    if action == "compound":
+        error = plan_error(str(response))
+        if error:
+            return None, error
+
+    try:
+        cooldown = int(row.get("cooldown") or 0)
+    except (TypeError, ValueError):
+        return None, "cooldown must be a whole number of minutes"
+    if cooldown < 0:
+        return None, "cooldown can't be negative"
+
+    expression_id = str(row.get("id") or "").strip()
+    return Expression(
+        expression_id if expression_id.isalnum() and len(expression_id) <= 32 else None,
+        trigger_type,
+        trigger,
+        action,
+        str(response),
+        cooldown,
+        str(row.get("created_by") or created_by)
+    ), None
+
+
+def validate_rows(rows, taken, created_by):
+    # Checks rows as they are read and gives every expression an id not in taken.
+    # Returns (expressions, errors), nothing should be imported when errors isn't empty.
+    expressions = []
+    errors = []
+    taken = set(taken)
+    try:
+        for number, row in enumerate(rows, 1):
+            if number > MAX_IMPORT_ROWS:
+                errors.append(f"More than {MAX_IMPORT_ROWS} expressions in one import.")
+                break
+            expression, error = parse_row(row, created_by)
+            if error:
+                errors.append(f"Row {number}: {error}")
+                if len(errors) >= MAX_ERRORS:
+                    break
+                continue
+            if expression.id is None or expression.id in taken:
+                expression.id = new_expression_id(taken)
+            taken.add(expression.id)
+            expressions.append(expression)
+    except (ValueError, csv.Error) as e:
+        errors.append(str(e))
+    return expressions, errors
+
+
+def apply_import(data, expressions, replace=False):
+    # One change to the expressions, the caller saves once and the index is rebuilt once
+    if replace:
+        data["expressions"].clear()
+    data["expressions"].update((expression.id, expression) for expression in expressions)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s:%(levelname)s:%(name)s: %(message)s')
+    parser = argparse.ArgumentParser(description="Export or import a guild's expressions")
+    parser.add_argument("command", choices=("export", "import"))
+    parser.add_argument("--guild", required=True, help="guild ID to export from or import into")
+    parser.add_argument("--output", help="file to export to, the format follows the extension")
+    parser.add_argument("--input", help="file to import from, the format follows the extension")
+    parser.add_argument("--replace", action="store_true", help="replace the guild's expressions instead of adding to them")
+    parser.add_argument("--data-dir", default=file_handling.DATA_DIR, help="directory with the per-guild JSON files")
+    parser.add_argument("--database", help="SQLite database to use instead of the JSON files")
+    args = parser.parse_args()
+
+    path = args.output if args.command == "export" else args.input
+    if not path:
+        parser.error(f"{args.command} needs --{'output' if args.command == 'export' else 'input'}")
+    fmt = guess_format(path)
+    if fmt is None:
+        parser.error(f"Unknown file type, use one of: {', '.join(FORMATS)}")
+
+    file_handling.DATA_DIR = args.data_dir
+    if args.database:
+        from sqlite_storage import SqliteBackend
+        file_handling.use_backend(SqliteBackend(args.database))
+
+    try:
+        data = file_handling.load_expressions(args.guild)
+        if args.command == "export":
+            with open(path, "w", newline="", encoding="utf-8") as file:
+                write_export((exp.to_dict() for exp in data["expressions"].values()), fmt, file)
+            logger.info(f"Exported {len(data['expressions'])} expressions from guild {args.guild} to {path}.")
+            return
+
+        with open(path, "r", newline="", encoding="utf-8-sig") as file:
+            text = file.read()
+        taken = () if args.replace else data["expressions"]
+        expressions, errors = validate_rows(read_rows(text, fmt), taken, "import")
+        if errors:
+            for error in errors:
+                logger.error(error)
+            logger.error("Nothing was imported.")
+            raise SystemExit(1)
+        apply_import(data, expressions, args.replace)
+        file_handling.save_expressions(args.guild, data)
+        logger.info(f"Imported {len(expressions)} expressions from {path} into guild {args.guild}.")
+    finally:
+        file_handling.get_backend().close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import asyncio
+import collections
+import config
+import discord
+import logging
+
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+icon = config.ICON_URL
+embed_color = 0xc15bb2
+footer_text = "Expressive"
+
+FLUSH_INTERVAL = 5.0    # seconds a log embed may wait for others to share its message
+MAX_EMBEDS = 10         # Discord allows up to 10 embeds per message
+MAX_QUEUED = 100        # per channel, the oldest embeds are dropped past this
+
+
+class LogQueue:
+    # Buffers log embeds per channel and sends them in batches of up to
+    # MAX_EMBEDS, either when a batch is full or every FLUSH_INTERVAL seconds.
+
+    def __init__(self):
+        self._queues = {}   # channel id -> (channel, deque of embeds)
+        self._flusher = None
+        self._sending = set()   # flushes of full batches, kept so they aren't garbage collected
+
+    def push(self, channel, embed):
+        entry = self._queues.get(channel.id)
+        if entry is None:
+            entry = self._queues[channel.id] = (channel, collections.deque(maxlen=MAX_QUEUED))
+        entry[1].append(embed)
+
+        if len(entry[1]) >= MAX_EMBEDS:
+            task = asyncio.create_task(self._flush_channel(channel.id))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+        elif self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(FLUSH_INTERVAL)
+        await self.flush()
+
+    async def flush(self):
+        await asyncio.gather(
+            *(self._flush_channel(channel_id) for channel_id in list(self._queues)),
+            *self._sending
+        )
+
+    async def _flush_channel(self, channel_id):
+        entry = self._queues.pop(channel_id, None)
+        if entry is None:
+            return
+        channel, embeds = entry
+        while embeds:
+            batch = [embeds.popleft() for _ in range(min(MAX_EMBEDS, len(embeds)))]
+            try:
+                await channel.send(embeds=batch)
+            except discord.HTTPException as e:
+                logger.warning(f"Failed to send {len(batch)} expression logs to channel {channel_id}: {e}")
+
+
+log_queue = LogQueue()
+
+
+def wants_log(server_data, log_type):
+    logs = server_data["info"].get("expression_logs", {})
+    return bool(logs.get(log_type, False) and logs.get("channel_id"))
+
+
+def _push(channel, log_message):
+    embed = discord.Embed(
+        title="Expression Log",
+        description=log_message,
+        colour=embed_color,
+        timestamp=datetime.now()
+    )
+    embed.set_footer(text=footer_text, icon_url=icon)
+    log_queue.push(channel, embed)
+
+
+def queue_log(guild, server_data, log_type, log_message):
+    # Non-blocking, the embed goes out with the next batch for the log channel
+    if not wants_log(server_data, log_type):
+        return
+
+    channel = guild.get_channel(server_data["info"]["expression_logs"]["channel_id"])
+    if channel:
+        _push(channel, log_message)
+
+
+def queue_notice(guild, server_data, log_message):
+    # For things the admins have to act on: goes to the log channel whatever is
+    # toggled, or to the system channel when no log channel is set
+    channel_id = server_data["info"].get("expression_logs", {}).get("channel_id")
+    channel = guild.get_channel(channel_id) if channel_id else guild.system_channel
+    if channel:
+        _push(channel, log_message)
@@ -0,0 +1,70 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = 300.0  # seconds between writes of the collected stats
+
+
+class ExpressionStats:
+    # Hit counts, last trigger times and cooldown skips per expression. on_message
+    # only bumps an in-memory delta; flush() adds the deltas to the expressions and
+    # saves each guild that changed once, through the store's write-behind queue.
+
+    def __init__(self):
+        self._pending = {}  # (guild_id, expression_id) -> [hits, last triggered, suppressed]
+
+    def _entry(self, guild_id, expression_id):
+        key = (guild_id, expression_id)
+        entry = self._pending.get(key)
+        if entry is None:
+            entry = self._pending[key] = [0, None, 0]
+        return entry
+
+    def hit(self, guild_id, expression_id, when):
+        entry = self._entry(guild_id, expression_id)
+        entry[0] += 1
+        entry[1] = when
+
+    def suppressed(self, guild_id, expression_id):
+        self._entry(guild_id, expression_id)[2] += 1
+
+    def totals(self, guild_id, expression):
+        # (hits, last triggered, suppressed) including what hasn't been flushed yet
+        entry = self._pending.get((int(guild_id), expression.id))
+        if entry is None:
+            return expression.hits, expression.last_triggered, expression.suppressed
+        return (
+            expression.hits + entry[0],
+            entry[1] or expression.last_triggered,
+            expression.suppressed + entry[2]
+        )
+
+    async def flush(self, store):
+        pending, self._pending = self._pending, {}
+        guilds = {}
+        for (guild_id, expression_id), entry in pending.items():
+            guilds.setdefault(guild_id, []).append((expression_id, entry))
+
+        for guild_id, entries in guilds.items():
+            try:
+                server_data = await store.load(guild_id)
+                index = await store.load_index(guild_id)
+            except Exception as e:
+                logger.error(f"Failed to load guild {guild_id} for expression stats: {e}")
+                continue
+            for expression_id, (hits, last_triggered, suppressed) in entries:
+                # Deleted since it fired, nothing to keep
+                expression = index.expressions.get(expression_id)
+                if expression is None:
+                    continue
+                expression.hits += hits
+                expression.suppressed += suppressed
+                if last_triggered is not None:
+                    expression.last_triggered = last_triggered
+            await store.save(guild_id, server_data)
+
+    async def flush_periodically(self, store, interval=FLUSH_INTERVAL):
+        while True:
+            await asyncio.sleep(interval)
+            await self.flush(store)
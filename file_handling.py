@@ -1,9 +1,31 @@
+import asyncio
 import os
 import json
 import logging
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from expression import Expression
+from matcher import GuildIndex, expressions_by_id
 
 logger = logging.getLogger(__name__)
 
+DATA_DIR = "serverdata"     # used by the JSON backend, see use_backend for others
+CACHE_SIZE = 1000       # guilds kept in memory, the least recently used ones are dropped
+CHECK_MTIME = False     # stat the file on every load so hand-edited files get picked up
+IO_WORKERS = 4          # threads used by the async store for file I/O and (de)serialization
+WRITE_BEHIND = True     # let the async store batch saves instead of writing on every call
+WRITE_DELAY = 2.0       # seconds a dirty guild waits before it is flushed
+MAX_RETRY_DELAY = 300.0     # longest wait before failed writes are tried again, it doubles up to this
+
+# guild_id -> [data, mtime, index]
+_cache = OrderedDict()
+# guilds whose last loaded or saved data had no expressions, survives cache eviction
+_no_expressions = set()
+
 def ensure_fields(data, defaults):
     for key, value in defaults.items():
         if key not in data:
@@ -12,36 +34,262 @@ def ensure_fields(data, defaults):
             ensure_fields(data[key], value)
     return data
 
-def load_expressions(guild_id):
-    dir = "serverdata"
-    filepath = f"{dir}/{guild_id}.json"
+def _filepath(guild_id):
+    return f"{DATA_DIR}/{guild_id}.json"
+
+def _mtime(filepath):
+    try:
+        return os.stat(filepath).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+def _remember(guild_id, data, mtime):
+    entry = _cache.get(guild_id)
+    # The index is kept up to date by the commands as long as the same data is saved back
+    index = entry[2] if entry is not None and entry[0] is data else None
+    _cache[guild_id] = [data, mtime, index]
+    _cache.move_to_end(guild_id)
+    if data["expressions"]:
+        _no_expressions.discard(guild_id)
+    else:
+        _no_expressions.add(guild_id)
+    while len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
 
-    if not os.path.exists(dir):
-        os.makedirs(dir)
+def _cached(guild_id):
+    entry = _cache.get(guild_id)
+    if entry is not None and not CHECK_MTIME:
+        _cache.move_to_end(guild_id)
+        return entry[0]
+    return None
 
-    if not os.path.exists(filepath):
-        with open(filepath, "w") as file:
-            json.dump({"info": {}, "expressions": []}, file)
+def _snapshot(data):
+    # Plain JSON copy handed to the backend, so commands can keep mutating the cached data
+    return {
+        **data,
+        "info": json.loads(json.dumps(data["info"])),
+        "expressions": [exp.to_dict() for exp in data["expressions"].values()]
+    }
+
+def _read(guild_id):
+    # Backends deal in the JSON schema, the cache holds Expression objects by id
+    data, mtime = _backend.read(guild_id)
+    data["expressions"] = expressions_by_id([Expression.from_dict(exp) for exp in data["expressions"]])
+    return data, mtime
+
+def _read_expressions(guild_id):
+    # Reading never creates anything, the file appears on the first save
+    filepath = _filepath(guild_id)
+    mtime = _mtime(filepath)
+    if mtime is None:
+        return {"info": {}, "expressions": []}, None
 
     try:
         with open(filepath, "r") as file:
             #logger.info(f"Loading expressions for guild {guild_id} from {filepath}")
             data = json.load(file)
-            
+
             data = ensure_fields(data, {"info": {}, "expressions": []})
 
-            return data
+            return data, mtime
     except (json.JSONDecodeError) as e:
-        # logger.error(f"Failed to load expressions for guild {guild_id}: {e}")
-        return {"info": {}, "expressions": []}
+        # Keep the broken file around instead of letting the next save overwrite it
+        logger.error(f"Failed to load expressions for guild {guild_id}, moved to {filepath}.corrupt: {e}")
+        os.replace(filepath, f"{filepath}.corrupt")
+        return {"info": {}, "expressions": []}, None
+
+def _write_expressions(guild_id, data):
+    # Write to a temp file and rename it over the old one, so a crash never leaves a torn file
+    filepath = _filepath(guild_id)
+    temp_path = f"{filepath}.tmp"
+
+    if not os.path.exists(DATA_DIR):
+        os.makedirs(DATA_DIR)
+
+    with open(temp_path, "w") as file:
+        json.dump(data, file, separators=(",", ":"))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, filepath)
+    # logger.info(f"Expressions for guild {guild_id} saved to {filepath}")
+
+    if hasattr(os, "O_DIRECTORY"):
+        dir_fd = os.open(DATA_DIR, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+    return _mtime(filepath)
+
+class JsonBackend:
+    # One JSON file per guild in DATA_DIR
+
+    def read(self, guild_id):
+        return _read_expressions(guild_id)
+
+    def write(self, guild_id, data):
+        return _write_expressions(guild_id, data)
+
+    def version(self, guild_id):
+        return _mtime(_filepath(guild_id))
+
+    def close(self):
+        pass
+
+_backend = JsonBackend()
+
+def use_backend(backend):
+    # Swap the storage backend, call before the bot starts handling events
+    global _backend
+    _backend.close()
+    _backend = backend
+    _cache.clear()
+    _no_expressions.clear()
+
+def get_backend():
+    return _backend
+
+def load_expressions(guild_id):
+    guild_id = str(guild_id)
+    entry = _cache.get(guild_id)
+    if entry is not None:
+        if not CHECK_MTIME or entry[1] == _backend.version(guild_id):
+            _cache.move_to_end(guild_id)
+            return entry[0]
+
+    data, mtime = _read(guild_id)
+    _remember(guild_id, data, mtime)
+    return data
 
 def save_expressions(guild_id, data):
-    dir = "serverdata"
-    filepath = f"{dir}/{guild_id}.json"
+    guild_id = str(guild_id)
+    _remember(guild_id, data, _backend.write(guild_id, _snapshot(data)))
+
+def drop_index(guild_id):
+    # After bulk changes to a guild's expressions, so the index is rebuilt once on next use
+    entry = _cache.get(str(guild_id))
+    if entry is not None:
+        entry[2] = None
+
+
+class ExpressionStore:
+    # Async front for the functions above. Backend I/O and JSON work run on a small
+    # thread pool and each guild's reads and writes are serialized by a lock, so
+    # nothing blocks the event loop. Shares the in-memory cache with the sync API.
+    # With WRITE_BEHIND, save only marks the guild dirty; dirty guilds are written
+    # once after WRITE_DELAY, and flush() writes whatever is left on shutdown.
+    # Guilds that fail to write stay dirty and are tried again with backoff.
+
+    def __init__(self, workers=IO_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="expressive-io")
+        self._locks = weakref.WeakValueDictionary()
+        self._dirty = {}        # guild_id -> data waiting to be written
+        self._flusher = None
+        self._failures = 0      # flushes in a row that had a failed write
+
+    def _lock(self, guild_id):
+        lock = self._locks.get(guild_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[guild_id] = lock
+        return lock
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def known_empty(self, guild_id):
+        # True when the guild is known to have no expressions, without any I/O.
+        # Hand edits are only picked up by a real load, so CHECK_MTIME turns this off.
+        return not CHECK_MTIME and str(guild_id) in _no_expressions
+
+    async def load(self, guild_id):
+        guild_id = str(guild_id)
+        data = self._dirty.get(guild_id)
+        if data is not None:
+            _remember(guild_id, data, None)
+            return data
+        data = _cached(guild_id)
+        if data is not None:
+            return data
+
+        async with self._lock(guild_id):
+            entry = _cache.get(guild_id)
+            if entry is not None:
+                if not CHECK_MTIME or entry[1] == await self._run(_backend.version, guild_id):
+                    _cache.move_to_end(guild_id)
+                    return entry[0]
+
+            started = time.perf_counter()
+            data, mtime = await self._run(_read, guild_id)
+            metrics.storage_latency.observe(time.perf_counter() - started, "load")
+            if guild_id in self._dirty:
+                # Saved while we were reading, the in-memory copy is newer
+                return self._dirty[guild_id]
+            _remember(guild_id, data, mtime)
+            return data
+
+    async def load_index(self, guild_id):
+        guild_id = str(guild_id)
+        data = await self.load(guild_id)
+        entry = _cache.get(guild_id)
+        if entry is None or entry[0] is not data:
+            return GuildIndex(data["expressions"])
+        if entry[2] is None:
+            entry[2] = GuildIndex(data["expressions"])
+        return entry[2]
+
+    async def save(self, guild_id, data):
+        guild_id = str(guild_id)
+        _remember(guild_id, data, None)
+        if not WRITE_BEHIND:
+            await self._write(guild_id, data)
+            return
+
+        self._dirty[guild_id] = data
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_later())
+
+    async def _write(self, guild_id, data):
+        snapshot = _snapshot(data)
+        async with self._lock(guild_id):
+            started = time.perf_counter()
+            mtime = await self._run(_backend.write, guild_id, snapshot)
+            metrics.storage_latency.observe(time.perf_counter() - started, "save")
+            entry = _cache.get(guild_id)
+            if entry is not None and entry[0] is data:
+                entry[1] = mtime
+
+    async def _flush_later(self, delay=None):
+        await asyncio.sleep(WRITE_DELAY if delay is None else delay)
+        await self.flush()
+
+    async def flush(self):
+        failed = {}
+        while self._dirty:
+            dirty, self._dirty = self._dirty, {}
+            results = await asyncio.gather(
+                *(self._write(guild_id, data) for guild_id, data in dirty.items()),
+                return_exceptions=True
+            )
+            for (guild_id, data), result in zip(dirty.items(), results):
+                if isinstance(result, Exception):
+                    logger.error(f"Failed to save expressions for guild {guild_id}: {result}")
+                    failed[guild_id] = data
+
+        if not failed:
+            self._failures = 0
+            return
+        # Keep them dirty, unless they were saved again in the meantime
+        for guild_id, data in failed.items():
+            self._dirty.setdefault(guild_id, data)
+        self._failures += 1
+        delay = min(WRITE_DELAY * 2 ** self._failures, MAX_RETRY_DELAY)
+        logger.warning(f"Retrying {len(failed)} failed guild saves in {delay:.0f} seconds.")
+        self._flusher = asyncio.create_task(self._flush_later(delay))
+
+    def close(self):
+        self._executor.shutdown(wait=True)
 
-    if not os.path.exists(dir):
-        os.makedirs(dir)
 
-    with open(filepath, "w") as file:
-        json.dump(data, file, indent=4)
-        # logger.info(f"Expressions for guild {guild_id} saved to {filepath}")
\ No newline at end of file
+store = ExpressionStore()
@@ -0,0 +1,22 @@
+import discord
+
+
+def gateway_settings(low_memory=False):
+    # Returns (intents, client options) for the bot. With low_memory only what
+    # on_message and the commands use is kept: guilds, channels, the bot's own
+    # member and the message being handled. Usernames are looked up on demand instead.
+    intents = discord.Intents.default()
+    intents.message_content = True
+    if not low_memory:
+        return intents, {}
+
+    intents.typing = intents.dm_typing = intents.dm_messages = False
+    intents.voice_states = intents.invites = intents.webhooks = False
+    intents.integrations = intents.guild_scheduled_events = False
+    intents.reactions = intents.emojis_and_stickers = False
+    intents.moderation = intents.auto_moderation = False
+    return intents, {
+        "max_messages": None,
+        "member_cache_flags": discord.MemberCacheFlags.none(),
+        "chunk_guilds_at_startup": False
+    }
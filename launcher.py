@@ -0,0 +1,69 @@
+# Runs the bot as several processes, each one owning a contiguous range of shards.
+# Usage: python launcher.py --shards 16 --per-process 4
+#
+# Every guild belongs to exactly one shard, so each guild's cache, index and
+# cooldowns live in exactly one process. The processes share the storage backend
+# (use SQLITE_PATH for a shared database). Only process 0 syncs the command tree.
+
+import argparse
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s:%(levelname)s:%(name)s: %(message)s')
+logger = logging.getLogger(__name__)
+
+RESTART_DELAY = 5       # seconds before a crashed process is started again
+
+
+def shard_ranges(shard_count, per_process):
+    return [
+        list(range(start, min(start + per_process, shard_count)))
+        for start in range(0, shard_count, per_process)
+    ]
+
+
+def spawn(index, shard_ids, shard_count):
+    env = dict(
+        os.environ,
+        EXPRESSIVE_PROCESS_INDEX=str(index),
+        EXPRESSIVE_SHARD_IDS=",".join(map(str, shard_ids)),
+        EXPRESSIVE_SHARD_COUNT=str(shard_count)
+    )
+    logger.info(f"Starting process {index} with shards {shard_ids[0]}-{shard_ids[-1]}.")
+    return subprocess.Popen([sys.executable, "bot.py"], env=env)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run Expressive as several sharded processes")
+    parser.add_argument("--shards", type=int, required=True, help="total shard count")
+    parser.add_argument("--per-process", type=int, default=4, help="shards run by each process")
+    args = parser.parse_args()
+
+    ranges = shard_ranges(args.shards, args.per_process)
+    processes = [spawn(index, shard_ids, args.shards) for index, shard_ids in enumerate(ranges)]
+
+    try:
+        while True:
+            time.sleep(1)
+            for index, process in enumerate(processes):
+                code = process.poll()
+                if code is None:
+                    continue
+                logger.error(f"Process {index} exited with code {code}, restarting in {RESTART_DELAY}s.")
+                time.sleep(RESTART_DELAY)
+                processes[index] = spawn(index, ranges[index], args.shards)
+    except KeyboardInterrupt:
+        logger.info("Stopping all processes.")
+        for process in processes:
+            # SIGINT lets bot.py close cleanly and flush pending saves
+            process.send_signal(signal.SIGINT)
+        for process in processes:
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import asyncio
+import logging
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+LAG_INTERVAL = 0.5      # seconds between event loop lag probes
+SHED_LAG = (0.25, 0.5, 2.0)     # lag in seconds at which each shedding level starts
+HOLD = 5.0              # seconds a level is kept after the lag drops, so it doesn't flap
+HOT_RATE = 20           # messages per second after which a guild counts as low priority
+HOT_WINDOW = 1.0        # seconds messages are counted over
+
+# What each level skips, every level also does what the ones below it do
+SHED_REACTIONS = 1      # react responses
+SHED_LOW_PRIORITY = 2   # trigger evaluation in low priority and flooding guilds and channels
+SHED_ALL = 3            # trigger evaluation everywhere, interactions are still answered
+
+
+class LoadShedder:
+    # Watches how late the event loop runs a periodic probe and turns that into a
+    # shedding level for on_message. The lag is read on demand too, so a blocked
+    # loop is noticed as soon as it runs the next message, not only on the next probe.
+    # Guilds sending more than HOT_RATE messages a second are treated as low
+    # priority, so a raid in one guild is shed before anyone else's messages.
+
+    def __init__(self, thresholds=SHED_LAG):
+        self.thresholds = tuple(thresholds)
+        self.low_priority_guilds = set()
+        self.low_priority_channels = set()
+        self.lag = 0.0
+        self._deadline = None   # when the running probe should wake up
+        self._level = 0
+        self._held_until = 0.0
+        self._rates = {}        # guild id -> [window start, messages in window]
+
+    async def monitor(self, interval=LAG_INTERVAL):
+        loop = asyncio.get_running_loop()
+        while True:
+            self._deadline = loop.time() + interval
+            await asyncio.sleep(interval)
+            self.lag = max(0.0, loop.time() - self._deadline)
+            metrics.loop_lag.observe(self.lag)
+            metrics.shed_level.set(self.level(loop.time()))
+            self._prune(loop.time())
+
+    def current_lag(self, now):
+        if self._deadline is None:
+            return self.lag
+        return max(self.lag, now - self._deadline)
+
+    def level(self, now):
+        lag = self.current_lag(now)
+        level = 0
+        for threshold in self.thresholds:
+            if lag < threshold:
+                break
+            level += 1
+        if level >= self._level:
+            if level > self._level:
+                logger.warning(f"Event loop {lag:.2f}s behind, shedding at level {level}.")
+            self._level = level
+            self._held_until = now + HOLD
+        elif now >= self._held_until:
+            self._level = level
+        return self._level
+
+    def count(self, guild_id, now):
+        # Called for every message, returns True while the guild is flooding
+        rate = self._rates.get(guild_id)
+        if rate is None or now - rate[0] >= HOT_WINDOW:
+            self._rates[guild_id] = [now, 1]
+            return False
+        rate[1] += 1
+        return rate[1] > HOT_RATE * HOT_WINDOW
+
+    def low_priority(self, guild_id, channel_id, hot):
+        return hot or guild_id in self.low_priority_guilds or channel_id in self.low_priority_channels
+
+    def _prune(self, now):
+        stale = [guild_id for guild_id, rate in self._rates.items() if now - rate[0] >= HOT_WINDOW]
+        for guild_id in stale:
+            del self._rates[guild_id]
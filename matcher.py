@@ -0,0 +1,401 @@
+import itertools
+import logging
+import random
+import re
+import regex
+import string
+import time
+
+try:
+    from re import _parser as sre_parse, _constants as sre_constants
+except ImportError:     # Python < 3.11
+    import sre_parse, sre_constants
+
+logger = logging.getLogger(__name__)
+
+# Below this many phrases plain substring checks beat walking the automaton in Python
+SMALL_MATCHER = 48
+
+ID_ALPHABET = string.ascii_letters + string.digits
+ID_LENGTH = 5
+
+MAX_PATTERN_LENGTH = 200    # characters in a regex trigger
+MAX_PATTERN_TEXT = 4000     # message characters searched by word and regex triggers
+PATTERN_BUDGET = 0.005      # seconds one guild's patterns may take on one message, searches stop after it
+PATTERN_STRIKES = 3         # overruns in a row before a guild's regex triggers are switched off
+
+PATTERN_TYPES = ("word", "regex")
+
+
+class PhraseMatcher:
+    # Aho-Corasick automaton over case-folded phrases. Phrases can be added and
+    # removed at any time; failure links are rebuilt lazily on the next search.
+
+    def __init__(self):
+        self._goto = [{}]
+        self._out = [set()]
+        self._fail = [0]
+        self._match = [()]
+        self._phrases = {}      # expression id -> case-folded phrase
+        self._nodes = {}        # expression id -> terminal node
+        self._always = set()    # ids with an empty phrase, these match every message
+        self._removed = 0
+        self._dirty = False
+
+    def __len__(self):
+        return len(self._phrases)
+
+    def add(self, expression_id, phrase):
+        if expression_id in self._phrases:
+            self.remove(expression_id)
+
+        phrase = phrase.casefold()
+        self._phrases[expression_id] = phrase
+        if not phrase:
+            self._always.add(expression_id)
+            return
+
+        node = 0
+        for char in phrase:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._out.append(set())
+            node = next_node
+        self._out[node].add(expression_id)
+        self._nodes[expression_id] = node
+        self._dirty = True
+
+    def remove(self, expression_id):
+        phrase = self._phrases.pop(expression_id, None)
+        if phrase is None:
+            return
+
+        self._always.discard(expression_id)
+        node = self._nodes.pop(expression_id, None)
+        if node is not None:
+            self._out[node].discard(expression_id)
+            self._removed += 1
+            self._dirty = True
+
+        # Dead trie branches are never pruned in place, start over once they pile up
+        if self._removed > len(self._goto) // 2:
+            self._rebuild_trie()
+
+    def _rebuild_trie(self):
+        phrases = self._phrases
+        self.__init__()
+        for expression_id, phrase in phrases.items():
+            self.add(expression_id, phrase)
+
+    def _build(self):
+        goto = self._goto
+        fail = [0] * len(goto)
+        match = [()] * len(goto)
+        queue = []
+
+        for node in goto[0].values():
+            match[node] = tuple(self._out[node])
+            queue.append(node)
+
+        for node in queue:
+            for char, child in goto[node].items():
+                state = fail[node]
+                while state and char not in goto[state]:
+                    state = fail[state]
+                fail[child] = goto[state].get(char, 0)
+                match[child] = tuple(self._out[child]) + match[fail[child]]
+                queue.append(child)
+
+        self._fail = fail
+        self._match = match
+        self._dirty = False
+
+    def search(self, text):
+        # Returns the ids of every phrase found in text, in a single pass.
+        text = text.casefold()
+        if len(self._phrases) <= SMALL_MATCHER:
+            return {expression_id for expression_id, phrase in self._phrases.items() if phrase in text}
+
+        if self._dirty:
+            self._build()
+
+        found = set(self._always)
+        if len(self._goto) == 1:
+            return found
+
+        goto = self._goto
+        fail = self._fail
+        match = self._match
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if match[state]:
+                found.update(match[state])
+        return found
+
+
+def pattern_source(trigger_type, trigger):
+    if trigger_type == "word":
+        # Like \\b, but also works for words that start or end with punctuation
+        return rf"(?<!\w){regex.escape(trigger.strip())}(?!\w)"
+    return trigger
+
+
+def _risky(subpattern, in_repeat=False):
+    # Nested unbounded repeats like (a+)+ and backreferences are what make
+    # the re module backtrack exponentially
+    for op, av in subpattern:
+        if op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+            low, high, sub = av
+            repeats = high > 1
+            if in_repeat and repeats:
+                return True
+            if _risky(sub, in_repeat or repeats):
+                return True
+        elif op == sre_constants.SUBPATTERN:
+            if _risky(av[-1], in_repeat):
+                return True
+        elif op == sre_constants.BRANCH:
+            if any(_risky(branch, in_repeat) for branch in av[1]):
+                return True
+        elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            if _risky(av[1], in_repeat):
+                return True
+        elif op in (sre_constants.GROUPREF, sre_constants.GROUPREF_EXISTS):
+            return True
+    return False
+
+
+def validate_trigger(trigger_type, trigger):
+    # Returns an error message for the user, or None when the trigger is fine
+    if trigger_type == "user":
+        return None
+    if not str(trigger).strip():
+        # An empty phrase is in every message
+        return "The trigger can't be empty."
+    if trigger_type not in PATTERN_TYPES:
+        return None
+    if trigger_type == "word":
+        return None
+
+    if len(trigger) > MAX_PATTERN_LENGTH:
+        return f"Regex triggers can be at most {MAX_PATTERN_LENGTH} characters long."
+    try:
+        parsed = sre_parse.parse(trigger)
+    except re.error as e:
+        return f"Invalid regex: {e}"
+    if parsed.state.groupdict:
+        return "Named groups aren't supported in regex triggers."
+    if _risky(parsed):
+        return "This regex could take too long on some messages. Avoid nested repeats like (a+)+ and backreferences."
+    try:
+        # Checked wrapped, the way it ends up in the guild's combined pattern
+        regex.compile(f"(?P<e0>{trigger})", regex.IGNORECASE)
+    except regex.error as e:
+        return f"Invalid regex: {e}"
+    if regex.search(trigger, ""):
+        return "This regex matches an empty message, so it would trigger on everything."
+    return None
+
+
+class PatternMatcher:
+    # Word and regex triggers, merged into one alternation with a named group per
+    # expression. The merged pattern finds a message with no matches in one pass;
+    # when it does match, the other patterns are checked one by one so overlapping
+    # matches are not lost. Searches run on the regex module, which stops them
+    # after PATTERN_BUDGET. Guilds that run out of it PATTERN_STRIKES messages in
+    # a row get their regex triggers switched off until the patterns change, word
+    # triggers keep working.
+
+    def __init__(self):
+        self._sources = {}      # expression id -> regex source
+        self._patterns = {}     # expression id -> compiled pattern on its own
+        self._regexes = set()   # expression ids of regex triggers
+        self._groups = {}       # group name -> expression id
+        self._combined = None
+        self._dirty = False
+        self.strikes = 0
+        self.disabled = False   # regex triggers switched off
+        self.reported = False   # the guild was told they were
+
+    def __len__(self):
+        return len(self._sources)
+
+    def add(self, expression_id, trigger_type, trigger):
+        source = pattern_source(trigger_type, trigger)
+        self._patterns[expression_id] = regex.compile(source, regex.IGNORECASE)
+        self._sources[expression_id] = source
+        if trigger_type == "regex":
+            self._regexes.add(expression_id)
+        self._changed()
+
+    def remove(self, expression_id):
+        if self._sources.pop(expression_id, None) is not None:
+            del self._patterns[expression_id]
+            self._regexes.discard(expression_id)
+            self._changed()
+
+    def _changed(self):
+        self._dirty = True
+        self.strikes = 0
+        self.disabled = False
+        self.reported = False
+
+    def _build(self):
+        parts = []
+        self._groups = {}
+        for number, (expression_id, source) in enumerate(self._sources.items()):
+            if self.disabled and expression_id in self._regexes:
+                continue
+            self._groups[f"e{number}"] = expression_id
+            parts.append(f"(?P<e{number}>{source})")
+        self._combined = regex.compile("|".join(parts), regex.IGNORECASE) if parts else None
+        self._dirty = False
+
+    def search(self, text):
+        if not self._sources:
+            return set()
+        if self._dirty:
+            self._build()
+        if self._combined is None:
+            return set()
+
+        text = text[:MAX_PATTERN_TEXT]
+        deadline = time.perf_counter() + PATTERN_BUDGET
+        try:
+            # The timeout covers the whole finditer, the searches after it get what's left
+            found = {self._groups[match.lastgroup] for match in self._combined.finditer(text, timeout=PATTERN_BUDGET)}
+            if found:
+                for expression_id in self._groups.values():
+                    if expression_id in found:
+                        continue
+                    left = deadline - time.perf_counter()
+                    if left <= 0:
+                        raise TimeoutError
+                    if self._patterns[expression_id].search(text, timeout=left):
+                        found.add(expression_id)
+        except TimeoutError:
+            self.strikes += 1
+            if self.strikes >= PATTERN_STRIKES and self._regexes and not self.disabled:
+                self.disabled = True
+                self._dirty = True
+            return set()
+
+        self.strikes = 0
+        return found
+
+
+class GuildIndex:
+    # Lookup structures derived from a guild's expressions, a dict of id ->
+    # expression in creation order. Kept next to the cached guild data in
+    # file_handling and updated by the management commands.
+
+    def __init__(self, expressions):
+        self.expressions = {}   # expression id -> expression
+        self.phrases = PhraseMatcher()
+        self.patterns = PatternMatcher()
+        self.users = {}         # author id -> user trigger expressions
+        self._user_keys = {}    # expression id -> author id it is indexed under
+        self._order = {}        # expression id -> position, so matches fire in creation order
+        self._positions = itertools.count()
+        for expression in expressions.values():
+            self.add(expression)
+
+    def new_id(self):
+        return new_expression_id(self.expressions)
+
+    def add(self, expression):
+        # Call after adding the expression to the guild's expressions
+        expression_id = expression.id
+        self.expressions[expression_id] = expression
+        if expression_id not in self._order:
+            self._order[expression_id] = next(self._positions)
+
+        trigger_type = expression.trigger_type
+        if trigger_type == "phrase":
+            self.phrases.add(expression_id, expression.folded)
+        elif trigger_type in PATTERN_TYPES:
+            try:
+                self.patterns.add(expression_id, trigger_type, expression.trigger)
+            except regex.error as e:
+                logger.warning(f"Skipping expression {expression_id} with an invalid pattern: {e}")
+        elif trigger_type == "user":
+            user_id = user_trigger(expression.trigger)
+            if user_id is not None:
+                self.users.setdefault(user_id, []).append(expression)
+                self._user_keys[expression_id] = user_id
+
+    def _unindex(self, expression):
+        expression_id = expression.id
+        self.expressions.pop(expression_id, None)
+        self.phrases.remove(expression_id)
+        self.patterns.remove(expression_id)
+
+        user_id = self._user_keys.pop(expression_id, None)
+        if user_id is not None:
+            bucket = [exp for exp in self.users[user_id] if exp.id != expression_id]
+            if bucket:
+                self.users[user_id] = bucket
+            else:
+                del self.users[user_id]
+
+    def update(self, expression):
+        # Call after editing the expression in place
+        self._unindex(expression)
+        self.add(expression)
+
+    def delete(self, expressions, expression):
+        # Removes the expression from the guild's expressions too, in O(1) and
+        # without changing the order of the others
+        expression_id = expression.id
+        del expressions[expression_id]
+        self._unindex(expression)
+        self._order.pop(expression_id, None)
+
+    def candidates(self, author_id, content):
+        # Every expression triggered by this author or by a phrase, word or pattern in content
+        matched = [self.expressions[expression_id] for expression_id in self.phrases.search(content)]
+        if self.patterns:
+            matched.extend(self.expressions[expression_id] for expression_id in self.patterns.search(content))
+        matched.extend(self.users.get(author_id, ()))
+        if len(matched) > 1:
+            order = self._order
+            matched.sort(key=lambda exp: order[exp.id])
+        return matched
+
+
+def expressions_by_id(expressions):
+    # The in-memory form of a guild's expression list, id -> expression in list order.
+    # Older versions never checked for collisions, duplicates get a new id, seeded
+    # so it stays the same across loads until the guild is saved again.
+    by_id = {}
+    taken = {expression.id for expression in expressions}
+    for position, expression in enumerate(expressions):
+        if expression.id in by_id:
+            new_id = new_expression_id(taken, random.Random(f"{expression.id}:{position}"))
+            logger.warning(f"Duplicate expression ID {expression.id}, renamed to {new_id}")
+            expression.id = new_id
+            taken.add(new_id)
+        by_id[expression.id] = expression
+    return by_id
+
+
+def new_expression_id(taken, rng=random):
+    # Random like before, but checked against the taken ids so it is always unique
+    while True:
+        expression_id = "".join(rng.choices(ID_ALPHABET, k=ID_LENGTH))
+        if expression_id not in taken:
+            return expression_id
+
+
+def user_trigger(trigger):
+    # User triggers used to be stored as strings, newer ones are ints
+    try:
+        return int(trigger)
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,153 @@
+import asyncio
+import bisect
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+MAX_GUILD_LABELS = 50   # guilds tracked individually, the rest are reported as "other"
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_metrics = []
+_guild_labels = {}
+
+
+def guild_label(guild_id):
+    label = _guild_labels.get(guild_id)
+    if label is not None:
+        return label
+    if len(_guild_labels) < MAX_GUILD_LABELS:
+        label = _guild_labels[guild_id] = str(guild_id)
+        return label
+    return "other"
+
+
+class Counter:
+    def __init__(self, name, help, label_name=None):
+        self.name = name
+        self.help = help
+        self.label_name = label_name
+        self.values = {}
+        _metrics.append(self)
+
+    def inc(self, label=None, amount=1):
+        self.values[label] = self.values.get(label, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for label, value in self.values.items():
+            lines.append(f"{self.name}{_labels(self.label_name, label)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    def set(self, value, label=None):
+        self.values[label] = value
+
+    def render(self):
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, label_name=None, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_name = label_name
+        self.buckets = buckets
+        self.values = {}    # label -> [count per bucket..., overflow count, sum]
+        _metrics.append(self)
+
+    def observe(self, value, label=None):
+        values = self.values.get(label)
+        if values is None:
+            values = self.values[label] = [0] * (len(self.buckets) + 1) + [0.0]
+        values[bisect.bisect_left(self.buckets, value)] += 1
+        values[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label, values in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), values):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(self.label_name, label, le=bound)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_name, label)} {values[-1]}")
+            lines.append(f"{self.name}_count{_labels(self.label_name, label)} {cumulative}")
+        return lines
+
+
+def _labels(label_name, label, le=None):
+    pairs = []
+    if label_name and label is not None:
+        pairs.append(f'{label_name}="{label}"')
+    if le is not None:
+        pairs.append(f'le="{le}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+messages_seen = Counter("expressive_messages_total", "Messages handled by on_message", "guild")
+expressions_evaluated = Counter("expressive_expressions_evaluated_total", "Candidate expressions checked", "guild")
+matches = Counter("expressive_matches_total", "Expressions that fired", "guild")
+throttled = Counter("expressive_throttled_total", "Messages not checked because a member or channel hit its throttle", "kind")
+cooldown_skips = Counter("expressive_cooldown_skips_total", "Matches skipped because of a cooldown", "guild")
+storage_latency = Histogram("expressive_storage_seconds", "Storage backend call latency", "operation")
+action_latency = Histogram("expressive_action_seconds", "handle_action REST call latency", "action")
+responses_dropped = Counter("expressive_responses_dropped_total", "Responses the dispatcher dropped", "reason")
+action_failures = Counter("expressive_action_failures_total", "handle_action calls that failed", "action")
+plans_running = Gauge("expressive_plans_running", "Compound expressions in flight")
+shard_latency = Gauge("expressive_shard_latency_seconds", "Gateway heartbeat latency", "shard")
+shard_up = Gauge("expressive_shard_up", "1 while the shard is connected", "shard")
+loop_lag = Histogram("expressive_event_loop_lag_seconds", "How late the event loop ran a scheduled probe")
+shed = Counter("expressive_shed_total", "Work skipped because the event loop was lagging", "kind")
+shed_level = Gauge("expressive_shed_level", "Current load shedding level, 0 when nothing is shed")
+
+
+def render():
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+async def _handle_request(reader, writer):
+    try:
+        await reader.readline()
+        body = render().encode()
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/plain; version=0.0.4\r\n"
+            b"Content-Length: " + str(len(body)).encode() + b"\r\n"
+            b"Connection: close\r\n\r\n" + body
+        )
+        await writer.drain()
+    finally:
+        writer.close()
+
+
+async def serve(port, host="127.0.0.1"):
+    # Prometheus text endpoint, every path returns the same page
+    server = await asyncio.start_server(_handle_request, host, port)
+    logger.info(f"Metrics available on http://{host}:{port}/metrics")
+    return server
+
+
+async def write_periodically(path, interval=15.0):
+    while True:
+        await asyncio.sleep(interval)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w") as file:
+            file.write(render())
+        os.replace(temp_path, path)
+
+
+def start(port=None, path=None):
+    # Called from setup_hook, returns the background tasks
+    tasks = []
+    if port:
+        tasks.append(asyncio.create_task(serve(port)))
+    if path:
+        tasks.append(asyncio.create_task(write_periodically(path)))
+    return tasks
@@ -0,0 +1,43 @@
+# One-shot import of the serverdata/*.json files into the SQLite backend.
+# Usage: python migrate.py [--source serverdata] [--database expressive.db]
+
+import argparse
+import json
+import logging
+import os
+
+from file_handling import ensure_fields
+from sqlite_storage import SqliteBackend
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s:%(levelname)s:%(name)s: %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def read_json_dir(source):
+    for name in sorted(os.listdir(source)):
+        if not name.endswith(".json"):
+            continue
+        guild_id = name[:-5]
+        try:
+            with open(os.path.join(source, name), "r") as file:
+                data = json.load(file)
+        except json.JSONDecodeError as e:
+            logger.error(f"Skipping {name}: {e}")
+            continue
+        yield guild_id, ensure_fields(data, {"info": {}, "expressions": []})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import serverdata/*.json into an SQLite database")
+    parser.add_argument("--source", default="serverdata", help="directory with the per-guild JSON files")
+    parser.add_argument("--database", default="expressive.db", help="SQLite database to import into")
+    args = parser.parse_args()
+
+    backend = SqliteBackend(args.database)
+    count = backend.write_many(read_json_dir(args.source))
+    backend.close()
+    logger.info(f"Imported {count} guilds from {args.source} into {args.database}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+import json
+import logging
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS guilds (
+    guild_id TEXT PRIMARY KEY,
+    info TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS expressions (
+    guild_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    trigger_type TEXT NOT NULL,
+    trigger,
+    action TEXT NOT NULL,
+    response TEXT NOT NULL,
+    cooldown INTEGER NOT NULL,
+    created_by TEXT,
+    extra TEXT,
+    PRIMARY KEY (guild_id, id)
+);
+CREATE INDEX IF NOT EXISTS expressions_trigger_type ON expressions (trigger_type);
+"""
+
+FIELDS = ("trigger_type", "trigger", "action", "response", "cooldown", "created_by")
+
+UPSERT_EXPRESSION = """
+INSERT INTO expressions (guild_id, id, trigger_type, trigger, action, response, cooldown, created_by, extra)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (guild_id, id) DO UPDATE SET
+    trigger_type = excluded.trigger_type,
+    trigger = excluded.trigger,
+    action = excluded.action,
+    response = excluded.response,
+    cooldown = excluded.cooldown,
+    created_by = excluded.created_by,
+    extra = excluded.extra
+"""
+
+UPSERT_GUILD = """
+INSERT INTO guilds (guild_id, info) VALUES (?, ?)
+ON CONFLICT (guild_id) DO UPDATE SET info = excluded.info
+"""
+
+
+def _row(guild_id, expression):
+    extra = {key: value for key, value in expression.items() if key != "id" and key not in FIELDS}
+    return (
+        guild_id,
+        expression["id"],
+        *(expression.get(field) for field in FIELDS),
+        json.dumps(extra, separators=(",", ":")) if extra else None
+    )
+
+
+def _expression(row):
+    expression = {"id": row[1]}
+    expression.update(zip(FIELDS, row[2:8]))
+    if row[8]:
+        expression.update(json.loads(row[8]))
+    return expression
+
+
+class SqliteBackend:
+    # Storage backend for file_handling.use_backend. Guild settings live in
+    # `guilds`, expressions are one row each keyed by (guild_id, id) and kept in
+    # creation (rowid) order. A save only touches the rows that changed.
+
+    def __init__(self, path="expressive.db"):
+        self.path = path
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._connect().executescript(SCHEMA)
+
+    def _connect(self):
+        # One connection per thread, WAL lets the readers run alongside a writer
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def read(self, guild_id):
+        guild_id = str(guild_id)
+        conn = self._connect()
+        row = conn.execute("SELECT info FROM guilds WHERE guild_id = ?", (guild_id,)).fetchone()
+        expressions = [
+            _expression(row) for row in conn.execute(
+                "SELECT * FROM expressions WHERE guild_id = ? ORDER BY rowid", (guild_id,)
+            )
+        ]
+        return {"info": json.loads(row[0]) if row else {}, "expressions": expressions}, None
+
+    def _write(self, conn, guild_id, data):
+        info = json.dumps(data["info"], separators=(",", ":"))
+        rows = {expression["id"]: _row(guild_id, expression) for expression in data["expressions"]}
+
+        old_info = conn.execute("SELECT info FROM guilds WHERE guild_id = ?", (guild_id,)).fetchone()
+        if old_info is None or old_info[0] != info:
+            conn.execute(UPSERT_GUILD, (guild_id, info))
+
+        old_rows = {
+            row[1]: tuple(row) for row in conn.execute(
+                "SELECT * FROM expressions WHERE guild_id = ?", (guild_id,)
+            )
+        }
+        conn.executemany(
+            "DELETE FROM expressions WHERE guild_id = ? AND id = ?",
+            [(guild_id, expression_id) for expression_id in old_rows if expression_id not in rows]
+        )
+        conn.executemany(
+            UPSERT_EXPRESSION,
+            [row for expression_id, row in rows.items() if old_rows.get(expression_id) != row]
+        )
+
+    def write(self, guild_id, data):
+        conn = self._connect()
+        with conn:
+            self._write(conn, str(guild_id), data)
+        return None
+
+    def write_many(self, items):
+        # Bulk import in a single transaction, items are (guild_id, data) pairs
+        conn = self._connect()
+        count = 0
+        with conn:
+            for guild_id, data in items:
+                self._write(conn, str(guild_id), data)
+                count += 1
+        return count
+
+    def version(self, guild_id):
+        return None
+
+    def close(self):
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
@@ -0,0 +1,75 @@
+import logging
+
+from cooldown_store import CooldownStore
+
+logger = logging.getLogger(__name__)
+
+# Defaults for guilds that haven't set their own with /expression_throttle, 0 turns a limit off
+USER_PER_MINUTE = 60        # messages per member that are checked for triggers, on average
+USER_BURST = 5              # messages a member can send at once before the average applies
+CHANNEL_PER_MINUTE = 300
+CHANNEL_BURST = 20
+
+DEFAULTS = {
+    "user_per_minute": USER_PER_MINUTE,
+    "user_burst": USER_BURST,
+    "channel_per_minute": CHANNEL_PER_MINUTE,
+    "channel_burst": CHANNEL_BURST
+}
+
+
+def _limits(settings, defaults=DEFAULTS):
+    # (seconds per message, seconds of burst) for members and for channels
+    settings = {**defaults, **(settings or {})}
+    limits = []
+    for kind in ("user", "channel"):
+        per_minute = settings[f"{kind}_per_minute"]
+        interval = 60 / per_minute if per_minute > 0 else 0
+        limits.append((interval, interval * max(1, settings[f"{kind}_burst"])))
+    return tuple(limits)
+
+
+
+class Throttle:
+    # Token buckets keyed by (guild_id, author_id) and (guild_id, channel_id),
+    # kept as GCRA: each key stores only the time its bucket is full again, in a
+    # CooldownStore, so idle buckets expire on their own and take no space.
+
+    def __init__(self, defaults=None):
+        self.defaults = {**DEFAULTS, **(defaults or {})}
+        self._default_limits = _limits(None, self.defaults)
+        self._users = CooldownStore()
+        self._channels = CooldownStore()
+        self._limits = {}   # guild id -> limits from _limits, for guilds seen since startup
+
+    def configured(self, guild_id):
+        return guild_id in self._limits
+
+    def configure(self, guild_id, settings):
+        limits = _limits(settings, self.defaults)
+        # Guilds on the defaults share one tuple
+        self._limits[guild_id] = self._default_limits if limits == self._default_limits else limits
+
+    def limited(self, guild_id, author_id, channel_id, now):
+        # Returns "user" or "channel" when that bucket is empty, otherwise takes a
+        # token from both and returns None
+        (user_interval, user_burst), (channel_interval, channel_burst) = self._limits.get(guild_id, self._default_limits)
+        user_key = (guild_id, author_id)
+        channel_key = (guild_id, channel_id)
+
+        user_wait = None
+        if user_interval:
+            user_wait = max(0.0, self._users.remaining(user_key, now)) + user_interval
+            if user_wait > user_burst:
+                return "user"
+        channel_wait = None
+        if channel_interval:
+            channel_wait = max(0.0, self._channels.remaining(channel_key, now)) + channel_interval
+            if channel_wait > channel_burst:
+                return "channel"
+
+        if user_wait is not None:
+            self._users.start(user_key, now, user_wait)
+        if channel_wait is not None:
+            self._channels.start(channel_key, now, channel_wait)
+        return None
@@ -0,0 +1,35 @@
+import hashlib
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+HASH_FILE = "command_tree.sha256"
+
+def command_tree_hash(tree):
+    payload = sorted((command.to_dict() for command in tree.get_commands()), key=lambda command: command["name"])
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+def _read_hash(path):
+    try:
+        with open(path, "r") as file:
+            return file.read().strip()
+    except FileNotFoundError:
+        return None
+
+def _write_hash(path, digest):
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w") as file:
+        file.write(digest)
+    os.replace(temp_path, path)
+
+async def sync_if_changed(tree, path=HASH_FILE, force=False):
+    # Returns True when the tree was synced, False when Discord already has it
+    digest = command_tree_hash(tree)
+    if not force and _read_hash(path) == digest:
+        return False
+
+    await tree.sync()
+    _write_hash(path, digest)
+    return True